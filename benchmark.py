@@ -0,0 +1,214 @@
+"""合成したフォルダで処理時間を計測する
+
+比較元(先)のフォルダをファイル数, 階層, 行数, 変更率, 同名ファイルの割合,
+行の長さの分布から生成し、エンジンと出力方法の組み合わせごとに各処理の時間を
+JSONに記録する。--baselineで以前の結果と比較できる。
+"""
+import sys
+import os
+import json
+import random
+import string
+import platform
+import tempfile
+from pathlib import Path
+
+import winmerge_xlsx
+from winmerge_xlsx import WinMergeXlsx, VERSION
+
+WORDS = string.ascii_letters + string.digits + '_'  # 行の中身に使う文字
+CHANGE_LINES_RATIO = 0.05  # 変更するファイルの中で変更する行の割合
+ONE_SIDE_RATIO = 0.02      # 片側にしかないファイルの割合(左右それぞれ)
+
+
+def random_line(rng, line_length):
+    """1行分の文字列を生成する(長さはline_length=(最小, 最頻, 最大)の三角分布)
+    """
+    length = int(rng.triangular(*line_length))
+    indent = ' ' * (4 * rng.randrange(4))
+    return indent + ''.join(rng.choices(WORDS + ' ', k=max(0, length - len(indent))))  # noqa: E501
+
+
+def change_lines(rng, lines, line_length):
+    """行の置換, 挿入, 削除を混ぜて変更する
+    """
+    lines = list(lines)
+    count = max(1, int(len(lines) * CHANGE_LINES_RATIO))
+    for _ in range(count):
+        i = rng.randrange(len(lines) + 1)
+        kind = rng.random()
+        if kind < 0.5 and i < len(lines):
+            lines[i] = random_line(rng, line_length)
+        elif kind < 0.8 or not lines:
+            lines[i:i] = [random_line(rng, line_length) for _ in range(rng.randint(1, 5))]  # noqa: E501
+        else:
+            del lines[i:i + rng.randint(1, 5)]
+    return lines
+
+
+def generate_tree(root, files=100, depth=2, lines=200, change_ratio=0.2, duplicate_ratio=0.1, line_length=(10, 40, 120), seed=0):  # noqa: E501
+    """root/base, root/latestに比較するフォルダを生成する
+
+    duplicate_ratioの割合のファイルは別のフォルダと同じファイル名にする
+    """
+    rng = random.Random(seed)
+    root = Path(root)
+    base = root / 'base'
+    latest = root / 'latest'
+
+    folders = [Path()]
+    for level in range(1, depth + 1):
+        for i in range(max(1, files // (10 * depth))):
+            parent = rng.choice([f for f in folders if len(f.parts) == level - 1])  # noqa: E501
+            folders.append(parent / f'dir{level}_{i}')
+
+    names = []
+    for i in range(files):
+        if names and rng.random() < duplicate_ratio:
+            names.append(rng.choice(names))
+        else:
+            names.append(f'file{i}' + rng.choice(('.py', '.c', '.h', '.txt')))  # noqa: E501
+
+    used = set()
+    for name in names:
+        folder = rng.choice(folders)
+        while (folder, name) in used:
+            folder = rng.choice(folders)
+        used.add((folder, name))
+
+        text = [random_line(rng, line_length) for _ in range(max(1, int(rng.expovariate(1 / lines))))]  # noqa: E501
+        side = rng.random()
+        if side >= ONE_SIDE_RATIO:
+            _write_lines(base / folder / name, text)
+        if ONE_SIDE_RATIO <= side < 2 * ONE_SIDE_RATIO:
+            continue
+        if rng.random() < change_ratio:
+            text = change_lines(rng, text, line_length)
+        _write_lines(latest / folder / name, text)
+    return base, latest
+
+
+def _write_lines(path, lines):
+    """ファイルに行を書き込む
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def run(base, latest, output, engine, backend, jobs, settings=None):
+    """1回実行して処理ごとの時間と回数を取得する
+    """
+    app = WinMergeXlsx(base, latest, output, jobs=jobs)
+    overrides = {'ENGINE': engine, 'BACKEND': backend, 'HASH_CACHE': False, **(settings or {})}  # noqa: E501
+    saved = {key: getattr(winmerge_xlsx, key) for key in overrides}
+    try:
+        for key, value in overrides.items():
+            setattr(winmerge_xlsx, key, value)
+        app.generate()
+    finally:
+        for key, value in saved.items():
+            setattr(winmerge_xlsx, key, value)
+
+    result = app.profiler.to_json()
+    phases = {}
+    for phase in result['phases']:
+        phases[phase['name']] = phases.get(phase['name'], 0) + phase['duration']  # noqa: E501
+    return {
+        'total': result['total'],
+        'phases': phases,
+        'counters': result['counters'],
+        'output_bytes': os.path.getsize(output) if os.path.exists(output) else None,  # noqa: E501
+    }
+
+
+def compare(results, baseline):
+    """以前の結果と処理ごとの時間を比較して表示する
+    """
+    def key(result):
+        return result['engine'], result['backend'], result['jobs']
+
+    previous = {}
+    for result in baseline['results']:
+        previous.setdefault(key(result), []).append(result)
+
+    print(f"\n[compare with {baseline['version']}]")
+    for result in results:
+        prev = previous.get(key(result))
+        if not prev:
+            continue
+        for name, seconds in [('total', result['total']), *result['phases'].items()]:  # noqa: E501
+            prev_seconds = [r['total'] if name == 'total' else r['phases'].get(name) for r in prev]  # noqa: E501
+            prev_seconds = [s for s in prev_seconds if s]
+            if not prev_seconds:
+                continue
+            best = min(prev_seconds)
+            print(f"- {'/'.join(map(str, key(result)))} {name}: {best:.3f}s -> {seconds:.3f}s ({seconds / best:.2f}x)")  # noqa: E501
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='合成したフォルダで処理時間を計測する')  # noqa: E501
+    parser.add_argument('--files', type=int, default=200, help='ファイル数')
+    parser.add_argument('--depth', type=int, default=2, help='フォルダの階層')
+    parser.add_argument('--lines', type=int, default=200, help='1ファイルの平均行数')  # noqa: E501
+    parser.add_argument('--change-ratio', type=float, default=0.2, help='変更するファイルの割合')  # noqa: E501
+    parser.add_argument('--duplicate-ratio', type=float, default=0.1, help='別のフォルダと同名にするファイルの割合')  # noqa: E501
+    parser.add_argument('--line-length', type=int, nargs=3, default=(10, 40, 120), metavar=('MIN', 'MODE', 'MAX'), help='行の長さの分布')  # noqa: E501
+    parser.add_argument('--seed', type=int, default=0, help='乱数のシード')
+    parser.add_argument('--engines', nargs='+', default=['native'], help='差分エンジン')  # noqa: E501
+    parser.add_argument('--backends', nargs='+', default=['xlsx'], help='xlsxの出力方法')  # noqa: E501
+    parser.add_argument('--jobs', type=int, nargs='+', default=[1], help='並列数')  # noqa: E501
+    parser.add_argument('--excel-application', choices=['excel', 'fake'], default='excel', help='comで使うExcel(fake : メモリ上の代用品)')  # noqa: E501
+    parser.add_argument('--repeat', type=int, default=3, help='繰り返し回数')
+    parser.add_argument('--work-dir', help='フォルダを生成する場所(省略時は一時フォルダ)')  # noqa: E501
+    parser.add_argument('--output', default='benchmark.json', help='結果を出力するJSON')  # noqa: E501
+    parser.add_argument('--baseline', help='比較する以前の結果のJSON')
+    args = parser.parse_args()
+
+    params = {
+        'files': args.files,
+        'depth': args.depth,
+        'lines': args.lines,
+        'change_ratio': args.change_ratio,
+        'duplicate_ratio': args.duplicate_ratio,
+        'line_length': list(args.line_length),
+        'seed': args.seed,
+    }
+    settings = {'EXCEL_APPLICATION': args.excel_application}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(args.work_dir or tmp).absolute()
+        print(f'[generate tree] {work_dir}')
+        base, latest = generate_tree(work_dir, **params)
+
+        results = []
+        for engine in args.engines:
+            for backend in args.backends:
+                for jobs in args.jobs:
+                    for i in range(args.repeat):
+                        output = work_dir / f'{engine}_{backend}_{jobs}.xlsx'
+                        result = run(base, latest, output, engine, backend, jobs, settings)  # noqa: E501
+                        results.append({'engine': engine, 'backend': backend, 'jobs': jobs, 'repeat': i, **result})  # noqa: E501
+
+    report = {
+        'version': VERSION,
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'params': params,
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+
+    print('\n[results]')
+    for result in results:
+        print(f"- {result['engine']}/{result['backend']}/{result['jobs']} #{result['repeat']}: {result['total']:.3f}s")  # noqa: E501
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,371 @@
+"""差分のデータモデル
+"""
+from collections import Counter, deque
+from datetime import datetime
+
+STATUS_IDENTICAL = 'identical'    # 同一
+STATUS_CHANGED = 'changed'        # 差分あり
+STATUS_LEFT_ONLY = 'left_only'    # 左側のみ
+STATUS_RIGHT_ONLY = 'right_only'  # 右側のみ
+STATUS_BINARY = 'binary'          # バイナリに差分あり
+STATUS_OTHER = 'other'            # その他(フォルダの差分, エラーなど)
+
+STATUS_TEXTS = {  # 一覧シートの比較結果の表示
+    STATUS_IDENTICAL: 'Text files are identical',
+    STATUS_CHANGED: 'Text files are different',
+    STATUS_LEFT_ONLY: 'Left only',
+    STATUS_RIGHT_ONLY: 'Right only',
+    STATUS_BINARY: 'Binary files are different',
+    STATUS_OTHER: 'Unknown',
+}
+
+OP_EQUAL = 'equal'      # 一致行
+OP_REPLACE = 'replace'  # 変更行
+OP_DELETE = 'delete'    # 削除行(左側のみ)
+OP_INSERT = 'insert'    # 追加行(右側のみ)
+OP_SKIP = 'skip'        # 省略した一致行のまとまり
+OP_MOVED_FROM = 'moved_from'  # 移動した行の移動元(左側のみ)
+OP_MOVED_TO = 'moved_to'      # 移動した行の移動先(右側のみ)
+
+CHANGED_OPS = frozenset((OP_REPLACE, OP_DELETE, OP_INSERT, OP_MOVED_FROM, OP_MOVED_TO))  # 差分がある行の編集操作  # noqa: E501
+REVIEW_OPS = CHANGED_OPS - {OP_MOVED_FROM}  # 確認する行の編集操作(移動は移動先だけを数える)
+
+DIFF_COLORS = {        # 差分シートの背景色
+    OP_EQUAL: 'FFFFFF',
+    OP_REPLACE: 'EFCB05',
+    OP_DELETE: 'EFCB05',
+    OP_INSERT: 'EFCB05',
+    OP_SKIP: 'DDEBF7',
+    OP_MOVED_FROM: 'D9C3E9',
+    OP_MOVED_TO: 'D9C3E9',
+    'blank': 'C0C0C0',  # 片側のみの行の空欄
+}
+INLINE_COLOR = 'FF0000'  # 行内で差分がある文字の色
+
+SKIP_TEXT = '... {}～{}行目 ({}行) 省略 ...'  # 省略した一致行の表示
+MOVED_TEXT = '移動元'                        # 追加列の移動元の行の表示
+
+MAX_SHEET_NAME = 31  # シート名の最大長
+SHEET_NAME_TABLE = str.maketrans({c: '_' for c in '[]:*?/\\'})  # シート名に使えない文字
+
+BINARY = 'binary'  # バイナリファイルのエンコーディング
+
+DATE_FORMAT = '%Y/%m/%d %H:%M:%S'  # 一覧シートの日時の表示形式
+TAB_SIZE = 4                       # タブの展開幅
+
+
+def format_date(timestamp):
+    """日時の表示
+    """
+    if timestamp is None:
+        return ''
+    return datetime.fromtimestamp(timestamp).strftime(DATE_FORMAT)
+
+
+def expand_tabs(text, spans=None):
+    """タブを展開した文字列と、それに合わせてずらした差分の範囲を取得する
+    """
+    if '\t' not in text:
+        return text, spans
+    if not spans:
+        return text.expandtabs(TAB_SIZE), spans
+    positions = [0]  # 展開前の各位置の展開後の位置
+    for c in text:
+        width = TAB_SIZE - positions[-1] % TAB_SIZE if c == '\t' else 1
+        positions.append(positions[-1] + width)
+    return text.expandtabs(TAB_SIZE), [(positions[start], positions[end]) for start, end in spans]  # noqa: E501
+
+
+def plan_sheet_names(pairs, reserved=()):
+    """ファイル比較レポートごとのシート名を{相対パス(rel_path): シート名}で決める
+
+    シートに使えない文字は_に置き換え、MAX_SHEET_NAME文字に切り詰める
+    切り詰めた後に同名(大文字小文字は区別しない)になるものが複数ある場合や
+    reservedのシート名と重なる場合は、_Nを含めてMAX_SHEET_NAME文字に収まるよう
+    末尾に_Nを付ける
+    """
+    pairs = [(pair, sanitize_sheet_name(pair.name)) for pair in pairs if pair.has_report]  # noqa: E501
+    memo = Counter(base[:MAX_SHEET_NAME].lower() for _, base in pairs)
+    used = {name.lower() for name in reserved}
+    count = Counter()
+    names = {}
+    for pair, base in pairs:
+        name = base[:MAX_SHEET_NAME]
+        key = name.lower()
+        if memo[key] >= 2 or key in used:
+            while True:  # _Nを付けた名前が別のファイル名と重なれば次の番号にする
+                count[key] += 1
+                suffix = f'_{count[key]}'
+                name = base[:MAX_SHEET_NAME - len(suffix)] + suffix
+                if name.lower() not in used:
+                    break
+        used.add(name.lower())
+        names[pair.rel_path] = name
+    return names
+
+
+def plan_report_names(pairs):
+    """ファイル比較レポート(html)のファイル名(拡張子なし)を{相対パス: ファイル名}で決める
+
+    report_nameはフォルダの区切りを_にするため別のファイルの組と重なることがある
+    (a_b/c.txtとa/b_c.txt)。重なる場合(大文字小文字は区別しない)は後のものに_Nを付ける
+    """
+    used = set()
+    names = {}
+    for pair in pairs:
+        if not pair.has_report:
+            continue
+        name = pair.report_name
+        count = 1
+        while name.lower() in used:
+            count += 1
+            name = f'{pair.report_name}_{count}'
+        used.add(name.lower())
+        names[pair.rel_path] = name
+    return names
+
+
+def sanitize_sheet_name(name):
+    """シート名に使えない文字を_に置き換える(先頭と末尾の'も使えない)
+    """
+    name = name.translate(SHEET_NAME_TABLE)
+    if name.startswith("'"):
+        name = '_' + name[1:]
+    if name.endswith("'"):
+        name = name[:-1] + '_'
+    return name or '_'
+
+
+class FileInfo:
+    """ファイルの中身から求めた情報
+    """
+    __slots__ = (
+        'digest',       # ファイル全体のハッシュ値
+        'encoding',     # テキストのエンコーディング(バイナリの場合はBINARY)
+        'line_hashes',  # 行ごとのハッシュ値の配列
+    )
+
+    def __init__(self, digest=None, encoding=None, line_hashes=None):
+        self.digest = digest
+        self.encoding = encoding
+        self.line_hashes = line_hashes
+
+
+class FilePair:
+    """比較するファイルの組
+    """
+    __slots__ = (
+        'name',        # ファイル名
+        'folder',      # 比較元(先)フォルダからの相対フォルダ
+        'status',      # 比較結果
+        'left',        # 比較元のファイルパス
+        'right',       # 比較先のファイルパス
+        'left_date',   # 比較元の更新日時
+        'right_date',  # 比較先の更新日時
+        'stats',       # 左右の(サイズ, 更新日時[ns], inode)
+        'infos',       # 左右のFileInfo
+        'opcodes',     # 行差分の編集操作
+        'report',      # ファイル比較レポート(html)のパス(WinMergeの場合)
+        'status_text',  # 比較結果の表示(WinMergeの場合)
+    )
+
+    def __init__(self, name, folder, left=None, right=None):
+        self.name = name
+        self.folder = folder
+        self.status = None
+        self.left = left
+        self.right = right
+        self.left_date = None
+        self.right_date = None
+        self.stats = (None, None)
+        self.infos = (FileInfo(), FileInfo())
+        self.opcodes = []
+        self.report = None
+        self.status_text = None
+
+    @property
+    def encodings(self):
+        """左右のテキストのエンコーディング
+        """
+        return self.infos[0].encoding, self.infos[1].encoding
+
+    def changed_groups(self, context=None):
+        """差分シート上で差分がある行のまとまりを(開始位置, 行数)のリストで取得する
+
+        開始位置は差分シートの最初の行を0とする(contextはcollapse_opcodes()と同じ)
+        移動した行は移動先だけを差分とし、移動元は含めない
+        """
+        return _group_runs((rows, tag in REVIEW_OPS) for tag, rows in self._sheet_runs(context))  # noqa: E501
+
+    def moved_groups(self, context=None):
+        """差分シート上で移動元の行のまとまりを(開始位置, 行数)のリストで取得する
+        """
+        return _group_runs((rows, tag == OP_MOVED_FROM) for tag, rows in self._sheet_runs(context))  # noqa: E501
+
+    def row_count(self, context=None):
+        """差分シートの行数
+        """
+        return sum(rows for _, rows in self._sheet_runs(context))
+
+    def _sheet_runs(self, context):
+        """編集操作ごとの(編集操作, 差分シートの行数)を順に取得する(省略した一致行は1行)
+        """
+        for tag, i1, i2, j1, j2 in collapse_opcodes(self.opcodes, context):
+            yield tag, 1 if tag == OP_SKIP else max(i2-i1, j2-j1)
+
+    @property
+    def has_report(self):
+        """ファイル比較レポートの有無
+
+        WinMergeの一覧から読み込んだ組はレポートへのリンクがあるものだけとする
+        """
+        if self.status_text is not None:
+            return self.report is not None
+        return self.status == STATUS_CHANGED
+
+    @property
+    def rel_path(self):
+        """比較元(先)フォルダからの相対パス(ファイルの組を区別するキー)
+        """
+        return self.folder + '\\' + self.name if self.folder else self.name
+
+    @property
+    def report_name(self):
+        """ファイル比較レポートの名前(別のファイルの組と重なることがある : plan_report_names())
+        """
+        if self.folder:
+            folder = self.folder.replace('\\', '_').replace('/', '_')
+            return folder + '_' + self.name
+        return self.name
+
+
+class DiffRow:
+    """差分シートの1行
+
+    left_spans, right_spansは行内で差分がある文字の範囲(開始, 終了)のリスト
+    """
+    __slots__ = (
+        'left_no', 'left_text', 'right_no', 'right_text', 'op',
+        'left_spans', 'right_spans',
+    )
+
+    def __init__(self, left_no, left_text, right_no, right_text, op, left_spans=None, right_spans=None):  # noqa: E501
+        self.left_no = left_no
+        self.left_text = left_text
+        self.right_no = right_no
+        self.right_text = right_text
+        self.op = op
+        self.left_spans = left_spans
+        self.right_spans = right_spans
+
+
+def changed_groups(ops):
+    """行ごとの編集操作の並びから差分がある行のまとまりを(開始位置, 行数)のリストで取得する
+
+    移動元の行は含めない(移動は移動先だけを数える)
+    """
+    return _group_runs((1, op in REVIEW_OPS) for op in ops)
+
+
+def moved_groups(ops):
+    """行ごとの編集操作の並びから移動元の行のまとまりを(開始位置, 行数)のリストで取得する
+    """
+    return _group_runs((1, op == OP_MOVED_FROM) for op in ops)
+
+
+def collapse_context(rows, context):
+    """差分がある行の前後context行だけを残し、それ以外の一致行を1行にまとめる
+
+    contextがNoneの場合はそのまま返す
+    まとめた行は左右それぞれ省略した行番号の範囲を表示する(OP_SKIP)
+    """
+    if context is None:
+        yield from rows
+        return
+
+    before = deque()  # 次の差分の前に表示する候補
+    after = 0         # 直前の差分の後に表示する残りの行数
+    skipped = []      # 省略した行の(最初の行, 最後の行) (左右)
+    for row in rows:
+        if row.op in CHANGED_OPS:
+            if skipped:
+                yield skip_row(skipped)
+                skipped = []
+            yield from before
+            before.clear()
+            yield row
+            after = context
+        elif after:
+            yield row
+            after -= 1
+        else:
+            before.append(row)
+            if len(before) > context:
+                _add_skipped(skipped, before.popleft())
+    for row in before:
+        _add_skipped(skipped, row)
+    if skipped:
+        yield skip_row(skipped)
+
+
+def _add_skipped(skipped, row):
+    """省略した行の範囲を広げる
+    """
+    if not skipped:
+        skipped.extend([[row.left_no, row.left_no], [row.right_no, row.right_no]])  # noqa: E501
+    else:
+        skipped[0][1] = row.left_no
+        skipped[1][1] = row.right_no
+
+
+def collapse_opcodes(opcodes, context):
+    """編集操作のうち差分の前後context行より離れた一致行の範囲をOP_SKIPにする
+
+    collapse_context()と同じ行を省略する(contextがNoneの場合はそのまま返す)
+    行を読む前に省略する範囲が分かるため、省略する行は読まずに済む
+    """
+    if context is None:
+        yield from opcodes
+        return
+
+    last = len(opcodes) - 1
+    for k, (tag, i1, i2, j1, j2) in enumerate(opcodes):
+        if tag != OP_EQUAL:
+            yield tag, i1, i2, j1, j2
+            continue
+        n = i2 - i1
+        head = min(context, n) if k > 0 else 0          # 直前の差分の後に表示する行数
+        tail = min(context, n - head) if k < last else 0  # 次の差分の前に表示する行数
+        if head:
+            yield OP_EQUAL, i1, i1 + head, j1, j1 + head
+        if head + tail < n:
+            yield OP_SKIP, i1 + head, i2 - tail, j1 + head, j2 - tail
+        if tail:
+            yield OP_EQUAL, i2 - tail, i2, j2 - tail, j2
+
+
+def skip_row(skipped):
+    """省略した行のまとまりを表す行
+
+    skippedは左右それぞれ省略した(最初の行, 最後の行)
+    """
+    texts = [
+        SKIP_TEXT.format(first, last, last - first + 1) if first else None
+        for first, last in skipped
+    ]
+    return DiffRow(None, texts[0], None, texts[1], OP_SKIP)
+
+
+def _group_runs(runs):
+    """(行数, 差分の有無)の並びから差分がある行のまとまりを求める
+    """
+    groups = []
+    row = 0
+    for count, changed in runs:
+        if changed and count:
+            if groups and groups[-1][0] + groups[-1][1] == row:
+                groups[-1] = (groups[-1][0], groups[-1][1] + count)
+            else:
+                groups.append((row, count))
+        row += count
+    return groups
@@ -0,0 +1,570 @@
+"""Excel(COM)の代わりにメモリ上で動くExcel.Application
+
+このツールが使うオブジェクトモデルの一部(Workbooks.Open, Worksheets, Range, Cells,
+End, Hyperlinks, Interior, Font, Borders, Copy, SaveAs, ActiveWindow)だけを実装する。
+Windows以外の環境でCOMを使う処理を動かし、呼び出し回数や時間を計測するために使う。
+"""
+import copy
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+from report_parser import iter_table_rows
+from xlsx_writer import (
+    XlsxBook, col_index, col_name, read_sheet_parts, NS_MAIN,
+)
+
+try:
+    from pywintypes import com_error
+except ImportError:  # Windows以外の環境
+    class com_error(Exception):
+        """COMのエラー(pywintypes.com_errorの代わり)
+        """
+
+MAX_ROWS = 1048576   # ワークシートの行数
+MAX_COLS = 16384     # ワークシートの列数
+MAX_SHEET_NAME = 31  # シート名の最大長
+WHITE = 0xFFFFFF     # 塗りつぶしなしのInterior.Color
+
+xlUp = -4162
+xlToLeft = -4159
+xlCalculationAutomatic = -4105
+
+_ADDRESS = re.compile(r'^\$?([A-Za-z]*)\$?(\d*)$')
+
+
+def parse_address(address):
+    """アドレス(A1, A1:B2, A:A, カンマ区切りの複数範囲)を(行1, 列1, 行2, 列2)のリストにする
+    """
+    areas = []
+    for area in address.split(','):
+        corners = []
+        for ref in area.split(':'):
+            match = _ADDRESS.match(ref.strip())
+            if not match:
+                raise com_error(f'invalid address: {address}')
+            col, row = match.groups()
+            corners.append((int(row) if row else None, col_index(col.upper()) if col else None))  # noqa: E501
+        (r1, c1), (r2, c2) = corners[0], corners[-1]
+        areas.append((r1 or 1, c1 or 1, r2 or MAX_ROWS, c2 or MAX_COLS))
+    return areas
+
+
+def rgb_to_color(rgb):
+    """RRGGBBをExcelの色の値(BGRの順)にする
+    """
+    return int(rgb[4:6] + rgb[2:4] + rgb[0:2], 16)
+
+
+def color_to_rgb(color):
+    """Excelの色の値(BGRの順)をRRGGBBにする
+    """
+    return f'{color & 0xFF:02X}{(color >> 8) & 0xFF:02X}{(color >> 16) & 0xFF:02X}'  # noqa: E501
+
+
+class Cell:
+    """セルの値と書式
+    """
+    __slots__ = ('value', 'formats', 'hyperlinks')
+
+    def __init__(self, value=None):
+        self.value = value
+        self.formats = {}
+        self.hyperlinks = []
+
+
+class Hyperlink:
+    """ハイパーリンク
+    """
+    def __init__(self, address='', sub_address='', text=''):
+        self.Address = address
+        self.SubAddress = sub_address
+        self.TextToDisplay = text
+
+
+class FakeExcel:
+    """Excel.Application
+    """
+    def __init__(self):
+        self.ScreenUpdating = True
+        self.EnableEvents = True
+        self.DisplayAlerts = True
+        self.Calculation = xlCalculationAutomatic
+        self.Workbooks = Workbooks(self)
+        self.active_book = None
+
+    @property
+    def ActiveWindow(self):
+        return Window(self.active_book)
+
+    def Quit(self):
+        self.Workbooks.books = []
+        self.active_book = None
+
+
+class Workbooks:
+    """開いているブックの一覧
+    """
+    def __init__(self, app):
+        self.app = app
+        self.books = []
+
+    @property
+    def Count(self):
+        return len(self.books)
+
+    def __call__(self, index):
+        return self.books[index - 1]
+
+    def Open(self, path):
+        path = Path(path)
+        if not path.exists():
+            raise com_error(f'{path} not found')
+        book = Workbook(self.app, path)
+        if path.suffix.lower() in ('.htm', '.html'):
+            book.load_html(path)
+        else:
+            book.load_xlsx(path)
+        self.books.append(book)
+        self.app.active_book = book
+        return book
+
+
+class Workbook:
+    """ブック
+    """
+    def __init__(self, app, path):
+        self.app = app
+        self.path = path
+        self.sheets = []
+        self.selected = []
+
+    @property
+    def Worksheets(self):
+        return Worksheets(self)
+
+    def Close(self, SaveChanges=False):
+        if self in self.app.Workbooks.books:
+            self.app.Workbooks.books.remove(self)
+        if self.app.active_book is self:
+            books = self.app.Workbooks.books
+            self.app.active_book = books[-1] if books else None
+
+    def SaveAs(self, path, FileFormat=None):
+        """値と書式の一部(塗りつぶし, フォント, 列幅, ハイパーリンク, ウィンドウ枠の固定,
+        ズーム, オートフィルタ)をxlsxファイルに保存する
+        """
+        book = XlsxBook(path)
+        for ws in self.sheets:
+            ws.save(book)
+        book.close()
+        self.path = Path(path)
+
+    def load_html(self, path):
+        """htmlの表を1枚目のシートに読み込む(Excelと同じくシート名はファイル名)
+        """
+        ws = Worksheet(self, path.stem[:MAX_SHEET_NAME])
+        self.sheets.append(ws)
+        for row, (_, cells) in enumerate(iter_table_rows(path), 1):
+            for col, cell in enumerate(cells, 1):
+                text = cell['text']
+                value = int(text) if text.strip().isdigit() else (text or None)  # noqa: E501
+                if value is None and not cell['background'] and not cell['href']:  # noqa: E501
+                    continue
+                target = Cell(value)
+                if cell['background']:
+                    target.formats['Interior.Color'] = rgb_to_color(cell['background'])  # noqa: E501
+                if cell['href']:
+                    target.hyperlinks.append(Hyperlink(cell['href'], '', text))
+                ws.cells[(row, col)] = target
+        self.selected = [ws]
+
+    def load_xlsx(self, path):
+        """xlsxファイルのシートの値を読み込む(このツールで出力したもののみ)
+        """
+        parts = read_sheet_parts(path)
+        if not parts:
+            raise com_error(f'{path} is not supported')
+        ns = {'m': NS_MAIN}
+        with zipfile.ZipFile(path) as zf:
+            strings = []
+            if 'xl/sharedStrings.xml' in zf.namelist():
+                root = ET.fromstring(zf.read('xl/sharedStrings.xml'))
+                strings = [''.join(t.text or '' for t in si.iter(f'{{{NS_MAIN}}}t')) for si in root.findall('m:si', ns)]  # noqa: E501
+            for name, part in parts.items():
+                ws = Worksheet(self, name)
+                self.sheets.append(ws)
+                root = ET.fromstring(zf.read(part))
+                for c in root.iter(f'{{{NS_MAIN}}}c'):
+                    match = re.match(r'([A-Z]+)(\d+)', c.get('r'))
+                    col, row = col_index(match.group(1)), int(match.group(2))
+                    if c.get('t') == 'inlineStr':
+                        value = ''.join(t.text or '' for t in c.iter(f'{{{NS_MAIN}}}t'))  # noqa: E501
+                    else:
+                        v = c.find('m:v', ns)
+                        if v is None:
+                            continue
+                        value = strings[int(v.text)] if c.get('t') == 's' else _number(v.text)  # noqa: E501
+                    ws.cells[(row, col)] = Cell(value)
+        self.selected = self.sheets[:1]
+
+    def unique_name(self, name, ws=None):
+        """ブック内で重複しないシート名(Excelと同じく末尾に" (2)"などを付ける)
+        """
+        names = {sheet.name.lower() for sheet in self.sheets if sheet is not ws}  # noqa: E501
+        if name.lower() not in names:
+            return name
+        n = 2
+        while f'{name} ({n})'.lower() in names:
+            n += 1
+        return f'{name} ({n})'
+
+
+class Worksheets:
+    """ブックのシートの一覧
+    """
+    def __init__(self, book):
+        self.book = book
+
+    @property
+    def Count(self):
+        return len(self.book.sheets)
+
+    def __call__(self, key):
+        if isinstance(key, (tuple, list)):
+            return SheetGroup([self._get(k) for k in key])
+        return self._get(key)
+
+    def __iter__(self):
+        return iter(list(self.book.sheets))
+
+    def _get(self, key):
+        if isinstance(key, int):
+            if not 1 <= key <= len(self.book.sheets):
+                raise com_error(f'sheet {key} not found')
+            return self.book.sheets[key - 1]
+        for ws in self.book.sheets:
+            if ws.name.lower() == str(key).lower():
+                return ws
+        raise com_error(f'sheet {key} not found')
+
+
+class SheetGroup:
+    """グループ化したシート
+    """
+    def __init__(self, sheets):
+        self.sheets = sheets
+
+    def Select(self):
+        book = self.sheets[0].book
+        book.selected = list(self.sheets)
+        book.app.active_book = book
+
+
+class Window:
+    """ウィンドウ(アクティブなブックの選択中のシートに設定する)
+    """
+    def __init__(self, book):
+        object.__setattr__(self, 'book', book)
+
+    def __getattr__(self, name):
+        return self.book.selected[0].window.get(name)
+
+    def __setattr__(self, name, value):
+        targets = self.book.selected if name == 'Zoom' else self.book.selected[:1]  # noqa: E501
+        for ws in targets:
+            ws.window[name] = value
+
+
+class Worksheet:
+    """ワークシート
+    """
+    def __init__(self, book, name):
+        self.book = book
+        self.name = name
+        self.cells = {}
+        self.columns = {}  # 列番号 -> 列全体の書式
+        self.window = {}
+        self.autofilter = None
+
+    @property
+    def Name(self):
+        return self.name
+
+    @Name.setter
+    def Name(self, name):
+        if self.book.unique_name(name, self) != name:
+            raise com_error(f'sheet name {name} is already used')
+        self.name = name
+
+    @property
+    def Index(self):
+        return self.book.sheets.index(self) + 1
+
+    @property
+    def Rows(self):
+        return Count(MAX_ROWS)
+
+    @property
+    def Columns(self):
+        return Count(MAX_COLS)
+
+    def Range(self, start, end=None):
+        areas = parse_address(start)
+        if end is not None:
+            (r1, c1, _, _), (_, _, r2, c2) = areas[0], parse_address(end)[-1]
+            areas = [(r1, c1, r2, c2)]
+        return Range(self, areas)
+
+    def Cells(self, row, col):
+        return Range(self, [(row, col, row, col)])
+
+    def Activate(self):
+        self.book.selected = [self]
+        self.book.app.active_book = self.book
+
+    Select = Activate
+
+    def Copy(self, Before=None, After=None):
+        target = After or Before
+        book = target.book
+        ws = copy.deepcopy(self, {id(self.book): book})
+        ws.name = book.unique_name(self.name)
+        index = target.Index if After else target.Index - 1
+        book.sheets.insert(index, ws)
+
+    def save(self, book):
+        """xlsxファイルのシートとして書き込む
+        """
+        sheet = book.add_sheet(self.name)
+        for col, formats in self.columns.items():
+            if 'ColumnWidth' in formats:
+                sheet.set_width(col_name(col), formats['ColumnWidth'])
+        sheet.zoom = self.window.get('Zoom')
+        if self.window.get('FreezePanes'):
+            sheet.freeze_row = self.window.get('SplitRow')
+        if self.autofilter:
+            sheet.autofilter = self.autofilter.replace('$', '')
+
+        rows = {}
+        for (row, col), cell in self.cells.items():
+            rows.setdefault(row, []).append((col, cell))
+        for row in sorted(rows):
+            cells = []
+            for col, cell in rows[row]:
+                formats = {**self.columns.get(col, {}), **cell.formats}
+                color = formats.get('Interior.Color')
+                style = book.styles.get(
+                    font=formats.get('Font.Name'),
+                    size=formats.get('Font.Size'),
+                    fill=color_to_rgb(color) if color not in (None, WHITE) else None,  # noqa: E501
+                )
+                cells.append((col_name(col), cell.value, style))
+                for hl in cell.hyperlinks:
+                    if hl.SubAddress:
+                        name, _, ref = hl.SubAddress.rpartition('!')
+                        sheet.add_hyperlink(f'{col_name(col)}{row}', name.strip("'"), ref)  # noqa: E501
+            sheet.write_row(row, cells)
+        sheet.close()
+
+    def last_row(self, row, col):
+        """列の中でrow行目から上方向に最初に値がある行(Ctrl+↑)
+        """
+        rows = [r for (r, c), cell in self.cells.items() if c == col and r <= row and cell.value not in (None, '')]  # noqa: E501
+        return max(rows, default=1)
+
+    def last_col(self, row, col):
+        """行の中でcol列目から左方向に最初に値がある列(Ctrl+←)
+        """
+        cols = [c for (r, c), cell in self.cells.items() if r == row and c <= col and cell.value not in (None, '')]  # noqa: E501
+        return max(cols, default=1)
+
+
+class Count:
+    """Rows, Columns(Countのみ)
+    """
+    def __init__(self, count):
+        self.Count = count
+
+
+class Range:
+    """セル範囲(複数の範囲も扱う)
+    """
+    def __init__(self, ws, areas):
+        object.__setattr__(self, 'ws', ws)
+        object.__setattr__(self, 'areas', areas)
+
+    def __iter__(self):
+        for r1, c1, r2, c2 in self.areas:
+            for row in range(r1, r2 + 1):
+                for col in range(c1, c2 + 1):
+                    yield Range(self.ws, [(row, col, row, col)])
+
+    def __setattr__(self, name, value):
+        if name == 'Value':
+            self._set_value(value)
+        else:
+            self.set_format(name, value)
+
+    @property
+    def Value(self):
+        r1, c1, r2, c2 = self.areas[0]
+        if (r1, c1) == (r2, c2):
+            cell = self.ws.cells.get((r1, c1))
+            return cell.value if cell else None
+        return tuple(
+            tuple(self._cell_value(row, col) for col in range(c1, c2 + 1))
+            for row in range(r1, r2 + 1)
+        )
+
+    @property
+    def Row(self):
+        return self.areas[0][0]
+
+    @property
+    def Column(self):
+        return self.areas[0][1]
+
+    @property
+    def Address(self):
+        addresses = []
+        for r1, c1, r2, c2 in self.areas:
+            address = f'${col_name(c1)}${r1}'
+            if (r1, c1) != (r2, c2):
+                address += f':${col_name(c2)}${r2}'
+            addresses.append(address)
+        return ','.join(addresses)
+
+    @property
+    def Interior(self):
+        return Format(self, 'Interior')
+
+    @property
+    def Font(self):
+        return Format(self, 'Font')
+
+    @property
+    def Borders(self):
+        return Format(self, 'Borders')
+
+    @property
+    def Hyperlinks(self):
+        return Hyperlinks(self)
+
+    def End(self, direction):
+        row, col = self.areas[0][:2]
+        if direction == xlUp:
+            return Range(self.ws, [(self.ws.last_row(row, col), col) * 2])
+        if direction == xlToLeft:
+            return Range(self.ws, [(row, self.ws.last_col(row, col)) * 2])
+        raise com_error(f'direction {direction} is not supported')
+
+    def Select(self):
+        self.ws.Activate()
+
+    def AutoFilter(self):
+        self.ws.autofilter = None if self.ws.autofilter else self.Address
+
+    def get_format(self, name, default=None):
+        """先頭のセルの書式
+        """
+        row, col = self.areas[0][:2]
+        cell = self.ws.cells.get((row, col))
+        if cell and name in cell.formats:
+            return cell.formats[name]
+        return self.ws.columns.get(col, {}).get(name, default)
+
+    def set_format(self, name, value):
+        """範囲の書式を設定する(列全体の場合は列の書式として設定する)
+        """
+        for r1, c1, r2, c2 in self.areas:
+            for col in range(c1, c2 + 1):
+                if r1 == 1 and r2 == MAX_ROWS:
+                    self.ws.columns.setdefault(col, {})[name] = value
+                    for (row, c), cell in self.ws.cells.items():
+                        if c == col:
+                            cell.formats.pop(name, None)
+                    continue
+                for row in range(r1, r2 + 1):
+                    self._cell(row, col).formats[name] = value
+
+    def cells(self):
+        """範囲内の値があるセル
+        """
+        for r1, c1, r2, c2 in self.areas:
+            if (r2 - r1 + 1) * (c2 - c1 + 1) <= len(self.ws.cells):
+                for row in range(r1, r2 + 1):
+                    for col in range(c1, c2 + 1):
+                        if (row, col) in self.ws.cells:
+                            yield self.ws.cells[(row, col)]
+                continue
+            for (row, col), cell in list(self.ws.cells.items()):
+                if r1 <= row <= r2 and c1 <= col <= c2:
+                    yield cell
+
+    def _set_value(self, value):
+        r1, c1, r2, c2 = self.areas[0]
+        if isinstance(value, (tuple, list)):
+            for row, values in enumerate(value, r1):
+                for col, v in enumerate(values, c1):
+                    self._cell(row, col).value = v
+            return
+        for r1, c1, r2, c2 in self.areas:
+            for row in range(r1, r2 + 1):
+                for col in range(c1, c2 + 1):
+                    self._cell(row, col).value = value
+
+    def _cell_value(self, row, col):
+        cell = self.ws.cells.get((row, col))
+        return cell.value if cell else None
+
+    def _cell(self, row, col):
+        cell = self.ws.cells.get((row, col))
+        if cell is None:
+            cell = self.ws.cells[(row, col)] = Cell()
+        return cell
+
+
+class Format:
+    """Interior, Font, Bordersなどの書式(範囲内のセルにまとめて設定する)
+    """
+    DEFAULTS = {'Interior.Color': WHITE}
+
+    def __init__(self, target, prefix):
+        object.__setattr__(self, 'target', target)
+        object.__setattr__(self, 'prefix', prefix)
+
+    def __getattr__(self, name):
+        key = self.prefix + '.' + name
+        return self.target.get_format(key, self.DEFAULTS.get(key))
+
+    def __setattr__(self, name, value):
+        self.target.set_format(self.prefix + '.' + name, value)
+
+
+class Hyperlinks:
+    """範囲内のハイパーリンク
+    """
+    def __init__(self, target):
+        self.target = target
+
+    @property
+    def Count(self):
+        return sum(len(cell.hyperlinks) for cell in self.target.cells())
+
+    def __iter__(self):
+        return iter([hl for cell in self.target.cells() for hl in cell.hyperlinks])  # noqa: E501
+
+    def Delete(self):
+        for cell in self.target.cells():
+            cell.hyperlinks = []
+
+
+def _number(text):
+    """数値の文字列を数値にする
+    """
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
@@ -0,0 +1,92 @@
+"""ファイルのハッシュ値のキャッシュ
+"""
+import sqlite3
+from array import array
+
+from diff_model import FileInfo
+
+ENTRY_OVERHEAD = 128  # 1件あたりの管理領域の見積もり(バイト)
+
+
+class HashCache:
+    """ファイルのハッシュ値をSQLiteに保存して次回以降の実行で再利用する
+
+    パス, サイズ, 更新日時, inodeが一致する場合のみキャッシュを使う
+    行のハッシュ値とエンコーディングは求め方(line_hash)が前回と同じ場合のみ使う
+    """
+    def __init__(self, path, max_bytes, line_hash):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(str(path))
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, '
+            'inode INTEGER, digest TEXT, encoding TEXT, line_hashes BLOB, '
+            'used INTEGER)'
+        )
+        self.conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')  # noqa: E501
+        self._check_line_hash(line_hash)
+        self.clock = self.conn.execute('SELECT COALESCE(MAX(used), 0) FROM files').fetchone()[0]  # noqa: E501
+        self.used = []
+        self.pending = []
+        self.hits = 0
+
+    def _check_line_hash(self, line_hash):
+        """行のハッシュ値の求め方が前回と異なれば保存済みの行のハッシュ値とエンコーディングを捨てる
+        """
+        row = self.conn.execute("SELECT value FROM meta WHERE key='line_hash'").fetchone()  # noqa: E501
+        if row is None or row[0] != line_hash:
+            with self.conn:
+                self.conn.execute('UPDATE files SET line_hashes=NULL, encoding=NULL')  # noqa: E501
+                self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('line_hash', ?)", (line_hash,))  # noqa: E501
+
+    def get(self, path, stat):
+        """キャッシュからFileInfoを取得する(無ければNone)
+        """
+        row = self.conn.execute(
+            'SELECT digest, encoding, line_hashes FROM files '
+            'WHERE path=? AND size=? AND mtime_ns=? AND inode=?',
+            (str(path), *stat),
+        ).fetchone()
+        if row is None:
+            return None
+
+        digest, encoding, blob = row
+        line_hashes = None
+        if blob is not None:
+            line_hashes = array('Q')
+            line_hashes.frombytes(blob)
+        self.clock += 1
+        self.used.append((self.clock, str(path)))
+        self.hits += 1
+        return FileInfo(digest, encoding, line_hashes)
+
+    def put(self, path, stat, info):
+        """FileInfoをキャッシュに登録する
+        """
+        blob = None
+        if info.line_hashes is not None:
+            blob = array('Q', info.line_hashes).tobytes()
+        self.clock += 1
+        self.pending.append((str(path), *stat, info.digest, info.encoding, blob, self.clock))  # noqa: E501
+
+    def close(self):
+        """キャッシュを保存して閉じる
+        """
+        with self.conn:
+            self.conn.executemany('UPDATE files SET used=? WHERE path=?', self.used)  # noqa: E501
+            self.conn.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)', self.pending)  # noqa: E501
+            self._evict()
+        self.conn.close()
+
+    def _evict(self):
+        """上限サイズを超えた分を古いものから削除する(LRU)
+        """
+        total = 0
+        stale = []
+        rows = self.conn.execute('SELECT path, LENGTH(line_hashes) FROM files ORDER BY used DESC')  # noqa: E501
+        for path, size in rows:
+            total += (size or 0) + ENTRY_OVERHEAD
+            if total > self.max_bytes:
+                stale.append((path,))
+        self.conn.executemany('DELETE FROM files WHERE path=?', stale)
@@ -0,0 +1,137 @@
+"""行内の差分(単語・文字単位)
+
+変更行の組ごとに単語(英数字の並び, 空白の並び, 記号1文字)または1文字を単位として
+比較し、差分がある文字の範囲(開始, 終了)のリストを求める。単位の並びの比較には
+行単位の差分と同じmatching_blocks()を使う。
+
+置換の範囲の中で左右のどの行を組にするかは、行の似ている度合いの合計が最大になるよう
+に決める。比較する組の数はALIGN_MAX_CELLSまでに抑え、超える範囲は上から順に組にする
+"""
+import re
+from collections import Counter
+
+from diff_model import OP_REPLACE, OP_DELETE, OP_INSERT
+from line_diff import matching_blocks
+
+INLINE_WORD = 'word'  # 単語単位
+INLINE_CHAR = 'char'  # 文字単位
+
+WORD = re.compile(r'\w+|\s+|[^\w\s]')  # 単語単位で比較するときの単位
+MAX_LINE_LENGTH = 4096   # 行内の差分を求める行の長さの上限(超える行は行全体を差分とみなす)
+MAX_COST = 256           # 行内の差分で調べる編集距離の上限
+ALIGN_MAX_CELLS = 10000  # 置換の範囲で似ている度合いを求める行の組の数の上限
+MIN_SIMILARITY = 0.5     # 変更行の組とみなす似ている度合いの下限
+
+
+def tokenize(text, mode=INLINE_WORD):
+    """行を比較する単位のリストにする
+    """
+    if mode == INLINE_CHAR:
+        return list(text)
+    return WORD.findall(text)
+
+
+def inline_spans(left, right, mode=INLINE_WORD):
+    """変更行の組の左右それぞれで差分がある文字の範囲のリストを取得する
+
+    隣り合う範囲はまとめる。行が長すぎる場合は(None, None)を返す
+    """
+    if len(left) > MAX_LINE_LENGTH or len(right) > MAX_LINE_LENGTH:
+        return None, None
+    a, b = tokenize(left, mode), tokenize(right, mode)
+    blocks = matching_blocks(a, b, MAX_COST)
+    return _changed_spans(a, [(i, n) for i, _, n in blocks]), _changed_spans(b, [(j, n) for _, j, n in blocks])  # noqa: E501
+
+
+def _changed_spans(tokens, blocks):
+    """一致する範囲(開始, 単位数)の並びから一致しない文字の範囲のリストを求める
+    """
+    spans = []
+    pos = k = 0
+    for start, n in blocks + [(len(tokens), 0)]:
+        end = pos + sum(map(len, tokens[k:start]))
+        if pos < end:
+            spans.append((pos, end))
+        pos = end + sum(map(len, tokens[start:start + n]))
+        k = start + n
+    return spans
+
+
+def _token_counts(line, mode):
+    """行の単位ごとの出現回数(インデントなどの空白は似ている度合いに含めない)
+    """
+    return Counter(token for token in tokenize(line[:MAX_LINE_LENGTH], mode) if not token.isspace())  # noqa: E501
+
+
+def _size(tokens):
+    """単位ごとの出現回数(Counter)から文字数を求める
+    """
+    return sum(len(token) * count for token, count in tokens.items())
+
+
+def similarity(a, b):
+    """単位ごとの出現回数(Counter)から2行の似ている度合い(0～1)を求める
+
+    共通する単位の文字数の割合で、並び順は考えない
+    """
+    total = _size(a) + _size(b)
+    if not total:
+        return 1.0
+    return 2 * _size(a & b) / total
+
+
+def align_lines(left, right, mode=INLINE_WORD):
+    """置換の範囲を(編集操作, 左開始, 左終了, 右開始, 右終了)のリストに分ける
+
+    似ている度合いがMIN_SIMILARITY以上の行を組(OP_REPLACE)にし、その合計が最大に
+    なる組み合わせを選ぶ。組にならない行は削除・追加とする。組が1つもできない場合や
+    左右の行数の積がALIGN_MAX_CELLSを超える場合は全体を1つの置換のままとする
+    """
+    n, m = len(left), len(right)
+    whole = [(OP_REPLACE, 0, n, 0, m)]
+    if n * m > ALIGN_MAX_CELLS:
+        return whole
+
+    a = [_token_counts(line, mode) for line in left]
+    b = [_token_counts(line, mode) for line in right]
+    a_sizes, b_sizes = [_size(c) for c in a], [_size(c) for c in b]
+    score = [[0.0] * (m + 1) for _ in range(n + 1)]
+    for i in range(n):
+        for j in range(m):
+            best = max(score[i][j + 1], score[i + 1][j])
+            shorter, total = min(a_sizes[i], b_sizes[j]), a_sizes[i] + b_sizes[j]  # noqa: E501
+            if 2 * shorter >= MIN_SIMILARITY * total:  # 文字数の差だけで下限を下回る組は調べない  # noqa: E501
+                s = similarity(a[i], b[j])
+                if s >= MIN_SIMILARITY:
+                    best = max(best, score[i][j] + s)
+            score[i + 1][j + 1] = best
+
+    pairs = []
+    i, j = n, m
+    while i and j:
+        if score[i][j] == score[i - 1][j]:
+            i -= 1
+        elif score[i][j] == score[i][j - 1]:
+            j -= 1
+        else:
+            pairs.append((i - 1, j - 1))
+            i, j = i - 1, j - 1
+    if not pairs:
+        return whole
+    pairs.reverse()
+
+    opcodes = []
+    i = j = 0
+    for pi, pj in pairs + [(n, m)]:
+        if i < pi:
+            opcodes.append((OP_DELETE, i, pi, j, j))
+        if j < pj:
+            opcodes.append((OP_INSERT, pi, pi, j, pj))
+        if pi < n:
+            if opcodes and opcodes[-1][0] == OP_REPLACE and opcodes[-1][2] == pi and opcodes[-1][4] == pj:  # noqa: E501
+                _, i1, _, j1, _ = opcodes[-1]
+                opcodes[-1] = (OP_REPLACE, i1, pi + 1, j1, pj + 1)
+            else:
+                opcodes.append((OP_REPLACE, pi, pi + 1, pj, pj + 1))
+        i, j = pi + 1, pj + 1
+    return opcodes
@@ -0,0 +1,425 @@
+"""行単位の差分(ヒストグラム差分)
+
+行のハッシュ値を整数のIDに置き換えてから比較する。出現回数の少ない行を手掛かりに
+一致する範囲を決めて分割していき(ヒストグラム差分)、どの行も出現回数が多すぎて
+手掛かりにならない範囲はMyersの差分で比較する。Myersの差分は編集距離がmax_costを
+超えた時点で打ち切り、そこから先はGREEDY_COSTの編集距離で最も先まで進む経路を
+繰り返しつないで比較する(範囲全体を置換とみなすことはしない)。
+
+結果はdifflib.SequenceMatcher.get_opcodes()と同じ(編集操作, 左開始, 左終了,
+右開始, 右終了)のリストで、差分シートの左右の行番号列とコード列にそのまま対応する
+
+find_moves()は削除した行と追加した行の中から同じ行の並びを探し、移動した行として
+編集操作を分け直す
+"""
+from array import array
+from bisect import bisect_left
+
+from diff_model import (
+    OP_EQUAL, OP_REPLACE, OP_DELETE, OP_INSERT, OP_MOVED_FROM, OP_MOVED_TO,
+)
+
+try:
+    import numpy as np
+except ImportError:  # NumPyが無い場合は1行ずつ比較する
+    np = None
+
+MAX_CHAIN = 64           # 手掛かりにする行の出現回数の上限
+DEFAULT_MAX_COST = 1024  # Myersの差分で調べる編集距離の上限
+GREEDY_COST = 64         # 上限を超えた範囲を少しずつ比較するときの1回の編集距離
+GALLOP_START = 8         # 一致する行をまとめて比較するときの最初の行数
+ANCHOR_MIN_LINES = 4096  # 1回だけ現れる行を手掛かりに分割してから比較する行数
+ANCHOR_MIN_RUN = 16      # 上記で手掛かりの行が平均して連続する行数の下限
+MOVE_MIN_LINES = 4       # 移動とみなす行の並びの最小行数
+
+
+def intern_lines(*sequences):
+    """行(のハッシュ値)の並びを左右で共通の整数IDの並びにする
+    """
+    ids = {}
+    return [[ids.setdefault(line, len(ids)) for line in sequence] for sequence in sequences]  # noqa: E501
+
+
+def diff_opcodes(a, b, max_cost=DEFAULT_MAX_COST):
+    """2つの行の並びの差分を編集操作のリストで取得する
+
+    先頭と末尾で一致する行は除いてから比較する
+    """
+    prefix, suffix = common_ends(a, b)
+    ahi, bhi = len(a) - suffix, len(b) - suffix
+    a_mid, b_mid = a[prefix:ahi], b[prefix:bhi]
+    if np is not None and min(len(a_mid), len(b_mid)) >= ANCHOR_MIN_LINES:
+        middle = anchored_blocks(a_mid, b_mid, max_cost)
+    else:
+        middle = matching_blocks(a_mid, b_mid, max_cost)
+    blocks = [(0, 0, prefix)]
+    blocks.extend((i + prefix, j + prefix, n) for i, j, n in middle)
+    blocks.append((ahi, bhi, suffix))
+    return _opcodes(blocks, len(a), len(b))
+
+
+def common_ends(a, b):
+    """先頭と末尾で一致する行数(NumPyがあれば配列同士でまとめて比較する)
+    """
+    if np is None:
+        prefix = _common_prefix(a, 0, len(a), b, 0, len(b))
+        return prefix, _common_suffix(a, prefix, len(a), b, prefix, len(b))
+
+    a, b = _as_uint64(a), _as_uint64(b)
+    n = min(len(a), len(b))
+    same = a[:n] == b[:n]
+    prefix = n if same.all() else int(same.argmin())
+    n -= prefix
+    same = a[len(a) - n:][::-1] == b[len(b) - n:][::-1]
+    suffix = n if same.all() else int(same.argmin())
+    return prefix, suffix
+
+
+def anchored_blocks(a, b, max_cost=DEFAULT_MAX_COST):
+    """左右で1回ずつしか現れない行を手掛かりに一致する範囲を取得する(NumPyが必要)
+
+    手掛かりの行が連続する範囲はそのまま一致とし、間の範囲だけを
+    matching_blocks()で比較する。手掛かりが途切れがちな場合は全体を比較する
+    """
+    pa, pb = unique_anchors(a, b)
+    breaks = np.flatnonzero((np.diff(pa) != 1) | (np.diff(pb) != 1))
+    if len(pa) < ANCHOR_MIN_RUN * (len(breaks) + 1):
+        return matching_blocks(a, b, max_cost)
+
+    blocks = []
+    i = j = 0
+    for first, last in zip(np.concatenate(([0], breaks + 1)).tolist(), np.concatenate((breaks, [len(pa) - 1])).tolist()):  # noqa: E501
+        start_a, start_b = int(pa[first]), int(pb[first])
+        blocks.extend(
+            (i + gi, j + gj, n)
+            for gi, gj, n in matching_blocks(a[i:start_a], b[j:start_b], max_cost)  # noqa: E501
+        )
+        n = int(pa[last]) - start_a + 1
+        blocks.append((start_a, start_b, n))
+        i, j = start_a + n, start_b + n
+    blocks.extend(
+        (i + gi, j + gj, n)
+        for gi, gj, n in matching_blocks(a[i:], b[j:], max_cost)
+    )
+    return blocks
+
+
+def unique_anchors(a, b):
+    """左右でそれぞれ1回だけ現れる行の位置の組を、左右とも増加する順に取得する
+
+    左の順に並べたときに右が増加しない組は最長増加部分列に含まれるものだけ残す
+    """
+    a, b = _as_uint64(a), _as_uint64(b)
+    a_values, a_index, a_counts = np.unique(a, return_index=True, return_counts=True)  # noqa: E501
+    b_values, b_index, b_counts = np.unique(b, return_index=True, return_counts=True)  # noqa: E501
+    a_values, a_index = a_values[a_counts == 1], a_index[a_counts == 1]
+    b_values, b_index = b_values[b_counts == 1], b_index[b_counts == 1]
+    _, ia, ib = np.intersect1d(a_values, b_values, assume_unique=True, return_indices=True)  # noqa: E501
+    pa, pb = a_index[ia], b_index[ib]
+    order = np.argsort(pa)
+    pa, pb = pa[order], pb[order]
+    if len(pb) > 1 and not (np.diff(pb) > 0).all():  # 移動した行がある
+        keep = _longest_increasing(pb.tolist())
+        pa, pb = pa[keep], pb[keep]
+    return pa, pb
+
+
+def _longest_increasing(values):
+    """最長増加部分列の位置のリスト
+    """
+    tails = []     # 長さごとの部分列の末尾の値
+    tail_at = []   # 長さごとの部分列の末尾の位置
+    prev = [-1] * len(values)
+    for k, value in enumerate(values):
+        n = bisect_left(tails, value)
+        if n == len(tails):
+            tails.append(value)
+            tail_at.append(k)
+        else:
+            tails[n] = value
+            tail_at[n] = k
+        prev[k] = tail_at[n - 1] if n else -1
+    result = []
+    k = tail_at[-1] if tail_at else -1
+    while k >= 0:
+        result.append(k)
+        k = prev[k]
+    result.reverse()
+    return result
+
+
+def _as_uint64(lines):
+    """行のハッシュ値の並びをuint64の配列にする(array('Q')はコピーしない)
+    """
+    if isinstance(lines, array):
+        return np.frombuffer(lines, dtype=np.uint64)
+    return np.asarray(lines, dtype=np.uint64)
+
+
+def matching_blocks(a, b, max_cost=DEFAULT_MAX_COST):
+    """一致する範囲を(左開始, 右開始, 行数)のリストで先頭から順に取得する
+    """
+    a, b = intern_lines(a, b)
+    blocks = []
+    stack = [(0, len(a), 0, len(b))]  # 後ろの範囲から積み、前の範囲から取り出す
+    while stack:
+        item = stack.pop()
+        if len(item) == 3:
+            blocks.append(item)
+            continue
+
+        alo, ahi, blo, bhi = item
+        n = _common_prefix(a, alo, ahi, b, blo, bhi)
+        if n:
+            blocks.append((alo, blo, n))
+            alo, blo = alo + n, blo + n
+        n = _common_suffix(a, alo, ahi, b, blo, bhi)
+        if n:
+            stack.append((ahi - n, bhi - n, n))
+            ahi, bhi = ahi - n, bhi - n
+        if alo == ahi or blo == bhi:
+            continue
+
+        found, lcs = _histogram_lcs(a, alo, ahi, b, blo, bhi)
+        if lcs:
+            i, j, n = lcs
+            stack.append((i + n, ahi, j + n, bhi))
+            stack.append(lcs)
+            stack.append((alo, i, blo, j))
+        elif found:
+            blocks.extend(_myers_blocks_greedy(a, alo, ahi, b, blo, bhi, max_cost))  # noqa: E501
+    return blocks
+
+
+def _common_prefix(a, alo, ahi, b, blo, bhi):
+    """先頭から一致する行数
+
+    区間をまとめて比較し、一致する間は区間を倍に広げる
+    """
+    n = 0
+    step = GALLOP_START
+    limit = min(ahi - alo, bhi - blo)
+    while n < limit:
+        k = min(step, limit - n)
+        if a[alo + n:alo + n + k] != b[blo + n:blo + n + k]:
+            while a[alo + n] == b[blo + n]:
+                n += 1
+            break
+        n += k
+        step *= 2
+    return n
+
+
+def _common_suffix(a, alo, ahi, b, blo, bhi):
+    """末尾から一致する行数
+
+    区間をまとめて比較し、一致する間は区間を倍に広げる
+    """
+    n = 0
+    step = GALLOP_START
+    limit = min(ahi - alo, bhi - blo)
+    while n < limit:
+        k = min(step, limit - n)
+        if a[ahi - n - k:ahi - n] != b[bhi - n - k:bhi - n]:
+            while a[ahi - n - 1] == b[bhi - n - 1]:
+                n += 1
+            break
+        n += k
+        step *= 2
+    return n
+
+
+def _histogram_lcs(a, alo, ahi, b, blo, bhi):
+    """出現回数が最も少ない行を含む一致範囲のうち最長のものを探す
+
+    (共通の行の有無, (左開始, 右開始, 行数)またはNone)を返す
+    共通の行があってもすべて出現回数がMAX_CHAINを超える場合はNoneとなる
+    """
+    index = {}
+    for i in range(alo, ahi):
+        index.setdefault(a[i], []).append(i)
+
+    found = False
+    best = None
+    best_count = MAX_CHAIN
+    j = blo
+    while j < bhi:
+        next_j = j + 1
+        positions = index.get(b[j])
+        if positions is not None:
+            found = True
+            if len(positions) <= best_count:
+                for i in positions:
+                    back = _common_suffix(a, alo, i, b, blo, j)
+                    forward = 1 + _common_prefix(a, i + 1, ahi, b, j + 1, bhi)
+                    si, sj = i - back, j - back
+                    ei, ej = i + forward, j + forward
+                    count = len(positions)
+                    if count > 1:  # 一致範囲の中で最も少ない出現回数
+                        count = min(len(index[a[k]]) for k in range(si, ei))
+                    next_j = max(next_j, ej)
+                    if best is None or ei - si > best[2] or count < best_count:  # noqa: E501
+                        best = (si, sj, ei - si)
+                        best_count = count
+        j = next_j
+    return found, best
+
+
+def _myers_blocks_greedy(a, alo, ahi, b, blo, bhi, max_cost):
+    """Myersの差分で一致する範囲を求める
+
+    編集距離がmax_costを超えた場合は最も先まで進んだ位置までを確定し、残りは
+    GREEDY_COSTずつ同じように先へ進める。どの行も出現回数が多い範囲でも、
+    全体を置換とみなさずに近くの一致を拾える
+    """
+    blocks, x, y = _myers(a, alo, ahi, b, blo, bhi, max_cost)
+    alo, blo = alo + x, blo + y
+    while alo < ahi and blo < bhi:
+        found, x, y = _myers(a, alo, ahi, b, blo, bhi, GREEDY_COST)
+        blocks.extend(found)
+        alo, blo = alo + x, blo + y
+    return blocks
+
+
+def _myers(a, alo, ahi, b, blo, bhi, max_cost):
+    """Myersの差分で一致する範囲を求める
+
+    (一致する範囲のリスト, 比較した左の行数, 右の行数)を返す。編集距離がmax_costを
+    超えた場合は、その編集距離で最も先まで進んだ位置までの結果を返す
+    """
+    n, m = ahi - alo, bhi - blo
+    max_d = min(n + m, max_cost)
+    offset = max_d + 1
+    v = [0] * (2 * max_d + 3)  # 対角線k(=x-y)ごとの到達したx
+    trace = []                 # 編集距離dごとの直前のv(対角線-d-1からd+1まで)
+    for d in range(max_d + 1):
+        trace.append(v[offset - d - 1:offset + d + 2])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
+            else:
+                x = v[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[alo + x] == b[blo + y]:
+                x, y = x + 1, y + 1
+            v[offset + k] = x
+            if x >= n and y >= m:
+                return _myers_blocks(trace, n, m, alo, blo), n, m
+
+    x, y = max(
+        ((v[offset + k], v[offset + k] - k) for k in range(-max_d, max_d + 1, 2)),  # noqa: E501
+        key=lambda p: p[0] + p[1] if p[0] <= n and 0 <= p[1] <= m else -1,
+    )
+    return _myers_blocks(trace, x, y, alo, blo), x, y
+
+
+def _myers_blocks(trace, x, y, alo, blo):
+    """Myersの差分の経路をたどって一致する範囲を先頭から順に取得する
+    """
+    blocks = []
+    for d in range(len(trace) - 1, 0, -1):
+        prev = trace[d]  # prev[k + d + 1] : 編集距離d-1で対角線kに到達したx
+        k = x - y
+        if k == -d or (k != d and prev[k - 1 + d + 1] < prev[k + 1 + d + 1]):
+            prev_k = k + 1   # 右側の行を追加
+            start_x = prev[prev_k + d + 1]
+        else:
+            prev_k = k - 1   # 左側の行を削除
+            start_x = prev[prev_k + d + 1] + 1
+        if x > start_x:
+            blocks.append((alo + start_x, blo + start_x - k, x - start_x))
+        x = prev[prev_k + d + 1]
+        y = x - prev_k
+    if x:
+        blocks.append((alo, blo, x))
+    blocks.reverse()
+    return blocks
+
+
+def _opcodes(blocks, n, m):
+    """一致する範囲の並びを編集操作のリストにする
+    """
+    opcodes = []
+    i = j = 0
+    for bi, bj, size in blocks + [(n, m, 0)]:
+        if i < bi and j < bj:
+            opcodes.append((OP_REPLACE, i, bi, j, bj))
+        elif i < bi:
+            opcodes.append((OP_DELETE, i, bi, j, bj))
+        elif j < bj:
+            opcodes.append((OP_INSERT, i, bi, j, bj))
+        if size:
+            if opcodes and opcodes[-1][0] == OP_EQUAL:
+                _, i1, _, j1, _ = opcodes[-1]
+                opcodes[-1] = (OP_EQUAL, i1, bi + size, j1, bj + size)
+            else:
+                opcodes.append((OP_EQUAL, bi, bi + size, bj, bj + size))
+        i, j = bi + size, bj + size
+    return opcodes
+
+
+def find_moves(opcodes, a, b, min_lines=MOVE_MIN_LINES):
+    """削除した行の並びと同じ並びが追加した行にあれば移動とみなして編集操作を分け直す
+
+    追加した行の連続するmin_lines行を索引にし、削除した行を先頭から順にたどって
+    索引を引くため、全体の行数にほぼ比例する時間で求まる。同じ置換の範囲の中での
+    一致や、すべて同じ行の並び(空行の連続など)は移動とみなさない
+    移動した行を含む置換の範囲は削除と追加に分ける
+    """
+    owner = array('l', [0]) * len(b)  # 追加した行 -> 編集操作の番号+1(0 : 追加していない行)  # noqa: E501
+    index = {}
+    for k, (tag, i1, i2, j1, j2) in enumerate(opcodes):
+        if tag in (OP_INSERT, OP_REPLACE):
+            owner[j1:j2] = array('l', [k + 1]) * (j2 - j1)
+            for j in range(j1, j2 - min_lines + 1):
+                key = tuple(b[j:j + min_lines])
+                if len(set(key)) > 1:
+                    index.setdefault(key, []).append(j)
+
+    moved_a = bytearray(len(a))
+    moved_b = bytearray(len(b))
+    found = False
+    for k, (tag, i1, i2, j1, j2) in enumerate(opcodes):
+        if tag not in (OP_DELETE, OP_REPLACE):
+            continue
+        i = i1
+        while i + min_lines <= i2:
+            best = None
+            for j in index.get(tuple(a[i:i + min_lines]), ())[:MAX_CHAIN]:
+                n = 0
+                while i + n < i2 and j + n < len(b) and owner[j + n] not in (0, k + 1) and a[i + n] == b[j + n]:  # noqa: E501
+                    n += 1
+                if n >= min_lines and (best is None or n > best[1]):
+                    best = (j, n)
+            if best is None:
+                i += 1
+                continue
+            j, n = best
+            moved_a[i:i + n] = b'\1' * n
+            moved_b[j:j + n] = b'\1' * n
+            owner[j:j + n] = array('l', [0]) * n  # 1度移動先にした行は使わない
+            found = True
+            i += n
+    if not found:
+        return opcodes
+
+    result = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == OP_EQUAL or not (any(moved_a[i1:i2]) or any(moved_b[j1:j2])):  # noqa: E501
+            result.append((tag, i1, i2, j1, j2))
+            continue
+        for lo, hi, moved in _moved_runs(moved_a, i1, i2):
+            result.append((OP_MOVED_FROM if moved else OP_DELETE, lo, hi, j1, j1))  # noqa: E501
+        for lo, hi, moved in _moved_runs(moved_b, j1, j2):
+            result.append((OP_MOVED_TO if moved else OP_INSERT, i2, i2, lo, hi))  # noqa: E501
+    return result
+
+
+def _moved_runs(moved, lo, hi):
+    """範囲を移動した行とそれ以外の行の連続する範囲(開始, 終了, 移動の有無)に分ける
+    """
+    start = lo
+    for k in range(lo + 1, hi + 1):
+        if k == hi or moved[k] != moved[start]:
+            yield start, k, bool(moved[start])
+            start = k
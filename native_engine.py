@@ -0,0 +1,696 @@
+"""WinMergeを使わずにフォルダ差分を取る
+"""
+import os
+import re
+import html
+import mmap
+import codecs
+import hashlib
+from array import array
+from collections import deque
+from contextlib import contextmanager
+from functools import partial, lru_cache
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from diff_model import (
+    FilePair, FileInfo, DiffRow, STATUS_TEXTS, DIFF_COLORS, INLINE_COLOR,
+    BINARY, DATE_FORMAT, format_date, collapse_opcodes, skip_row, expand_tabs,
+    STATUS_IDENTICAL, STATUS_CHANGED, STATUS_LEFT_ONLY, STATUS_RIGHT_ONLY,
+    STATUS_BINARY, OP_EQUAL, OP_REPLACE, OP_DELETE, OP_INSERT, OP_SKIP,
+    OP_MOVED_FROM, OP_MOVED_TO, plan_report_names,
+)
+from line_diff import DEFAULT_MAX_COST, diff_opcodes, find_moves
+from inline_diff import INLINE_WORD, ALIGN_MAX_CELLS, align_lines, inline_spans
+
+try:
+    import numpy as np
+except ImportError:  # NumPyが無い場合は1行ずつハッシュ値を求める
+    np = None
+
+BINARY_CHECK_SIZE = 8192                   # バイナリ判定で調べるサイズ
+TEXT_ENCODINGS = ('utf-8', 'cp932')        # テキストとして試すエンコーディング
+FALLBACK_ENCODING = 'latin-1'              # 上記で読めない場合
+WIDE_BOMS = (                              # UTF-16/32のBOM(UTF-32LEのBOMはUTF-16LEのBOMで始まるため先に調べる)  # noqa: E501
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+WIDE_ENCODINGS = ('utf-16', 'utf-32')      # 行の区切りを探す前にUTF-8に変換するエンコーディング  # noqa: E501
+MAX_CHUNKSIZE = 64                         # 並列処理で1度に渡すファイル数の上限
+HASH_CHUNK_SIZE = 1024 * 1024              # ハッシュ計算で1度に読むサイズ
+DECODE_CHUNK_SIZE = 1024 * 1024            # エンコーディングの判定で1度にデコードするサイズ
+SPAN_CHUNK_SIZE = 64 * 1024                # 行の位置を1度にPythonのリストにする行数
+READ_LINES = 1024                          # 一致行をまとめてデコードする行数
+HASH_DIGEST_SIZE = 16                      # ハッシュ値のバイト数
+LINE_HASH_SIZE = 8                         # 行のハッシュ値のバイト数
+LINE_HASH = 'blake2b-utf8' if np is None else 'poly31x2-utf8'  # 行のハッシュ値の求め方(キャッシュとの互換性の確認に使う)  # noqa: E501
+LINE_HASH_BLOCK_SIZE = 256 * 1024          # NumPyで1度にハッシュ値を求めるバイト数の目安
+LINE_HASH_MAX_LENGTH = 4096                # NumPyでハッシュ値を求める行の長さの上限(超える行はblake2b)  # noqa: E501
+LINE_HASH_MODULI = (2147483647, 2147483629)  # 多項式ハッシュの法(2つの素数)
+LINE_HASH_BASES = (1103515245, 1664525123)   # 多項式ハッシュの基数
+LINE_HASH_LENGTH_FACTOR = 0x9E3779B97F4A7C15  # 多項式ハッシュに行の長さを混ぜるときの係数
+NEWLINE = re.compile(rb'\r\n|\r|\n')         # 改行(bytes.splitlines()と同じ)
+
+DEFAULT_OPTIONS = {                        # 比較のオプション
+    'quick_compare_by_date': False,        # サイズと更新日時が同じなら同一とみなす
+    'hash_use_mmap': False,                # ハッシュ計算にmmapを使う
+    'diff_max_cost': DEFAULT_MAX_COST,     # 行差分で調べる編集距離の上限(超えた範囲は少しずつ先へ進めて比較する)  # noqa: E501
+    'inline_diff': INLINE_WORD,            # 行内の差分の単位('word' : 単語, 'char' : 文字, None : 求めない)  # noqa: E501
+    'detect_moves': True,                  # 削除した行と同じ並びの追加した行を移動とみなす
+}
+
+
+@contextmanager
+def open_buffer(path):
+    """ファイルを読み取り専用でmmapする(空のファイルはb'')
+
+    withを抜けるまでに作ったmemoryviewなどは解放しておくこと
+    """
+    with open(path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            yield b''
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            yield m
+
+
+def is_binary(data):
+    """バイナリデータかどうか(UTF-16/32のBOMがあればNULを含んでもテキストとする)
+    """
+    if wide_encoding(data):
+        return False
+    return b'\0' in data[:BINARY_CHECK_SIZE]
+
+
+def wide_encoding(data):
+    """BOMからUTF-16/32のエンコーディングを判定する(BOMが無ければNone)
+    """
+    for bom, encoding in WIDE_BOMS:
+        if data[:len(bom)] == bom:
+            return encoding
+    return None
+
+
+def to_utf8(data, encoding):
+    """UTF-16/32のテキストをUTF-8に変換する(行の区切りを1バイトの改行で探すため)
+
+    それ以外のエンコーディングはそのまま返す
+    """
+    if encoding not in WIDE_ENCODINGS:
+        return data
+    return codecs.decode(data, encoding, 'replace').encode('utf-8')
+
+
+def detect_encoding(data):
+    """テキストのエンコーディングを判定する
+
+    全体を1度に文字列にしないよう、DECODE_CHUNK_SIZEずつデコードできるか確かめる
+    """
+    if data[:len(codecs.BOM_UTF8)] == codecs.BOM_UTF8:
+        return 'utf-8-sig'
+    encoding = wide_encoding(data)
+    if encoding:
+        return encoding
+    for encoding in TEXT_ENCODINGS:
+        if _can_decode(data, encoding):
+            return encoding
+    return FALLBACK_ENCODING
+
+
+def _can_decode(data, encoding):
+    """全体をエンコーディングでデコードできるかどうか
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    with memoryview(data) as view:
+        try:
+            for i in range(0, len(view), DECODE_CHUNK_SIZE):
+                decoder.decode(view[i:i+DECODE_CHUNK_SIZE])
+            decoder.decode(b'', final=True)
+        except UnicodeDecodeError:
+            return False
+    return True
+
+
+def line_spans(data):
+    """各行の(開始位置, 終了位置)を順に取得する
+
+    改行の扱いはbytes.splitlines()と同じ(\n, \r\n, \r)で、改行は含まない
+    """
+    if np is not None:
+        starts, ends = line_bounds(np.frombuffer(data, dtype=np.uint8))
+        for i in range(0, len(starts), SPAN_CHUNK_SIZE):
+            yield from zip(starts[i:i+SPAN_CHUNK_SIZE].tolist(), ends[i:i+SPAN_CHUNK_SIZE].tolist())  # noqa: E501
+        return
+
+    start = 0
+    for match in NEWLINE.finditer(data):
+        yield start, match.start()
+        start = match.end()
+    if start < len(data):
+        yield start, len(data)
+
+
+def line_hashes(data):
+    """行ごとのハッシュ値の配列を取得する
+
+    NumPyがあれば全体をまとめて求める(求め方が異なるためLINE_HASHで区別する)
+    """
+    if np is not None:
+        return _line_hashes_numpy(data)
+    hashes = array('Q')
+    with memoryview(data) as view:
+        for start, end in line_spans(data):
+            digest = hashlib.blake2b(view[start:end], digest_size=LINE_HASH_SIZE).digest()  # noqa: E501
+            hashes.append(int.from_bytes(digest, 'little'))
+    return hashes
+
+
+def line_bounds(buf):
+    """各行の開始位置と終了位置(改行を含まない)の配列を取得する
+
+    bufはuint8の配列で、改行の扱いはbytes.splitlines()と同じ(\n, \r\n, \r)
+    """
+    lf = buf == 0x0A
+    cr = buf == 0x0D
+    cr[:-1] &= ~lf[1:]  # \r\nの\rは改行とみなさない
+    terms = np.flatnonzero(lf | cr)
+    ends = terms.copy()
+    crlf = (buf[terms] == 0x0A) & (terms > 0)
+    crlf[crlf] = buf[terms[crlf] - 1] == 0x0D
+    ends[crlf] -= 1
+    starts = np.concatenate(([0], terms + 1))
+    ends = np.concatenate((ends, [len(buf)]))
+    if starts[-1] == len(buf):  # 最後が改行で終わる場合
+        starts, ends = starts[:-1], ends[:-1]
+    return starts, ends
+
+
+def _line_hashes_numpy(data):
+    """行ごとのハッシュ値をNumPyでまとめて求める
+
+    行の各バイトを係数とする多項式ハッシュを2つの素数を法として累積和から求め、
+    行の長さと混ぜて撹拌する。LINE_HASH_MAX_LENGTHを超える行はblake2bで求める
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    starts, ends = line_bounds(buf)
+    hashes = np.empty(len(starts), dtype=np.uint64)
+    long_lines = np.flatnonzero(ends - starts > LINE_HASH_MAX_LENGTH)
+    with memoryview(data) as view:
+        for k in long_lines.tolist():
+            digest = hashlib.blake2b(view[starts[k]:ends[k]], digest_size=LINE_HASH_SIZE).digest()  # noqa: E501
+            hashes[k] = int.from_bytes(digest, 'little')
+
+    tables = _hash_powers()
+    i = 0
+    while i < len(starts):  # 行の途中で区切らないようにLINE_HASH_BLOCK_SIZEずつ求める
+        n = int(np.searchsorted(long_lines, i))
+        if n < len(long_lines) and long_lines[n] == i:
+            i += 1
+            continue
+        j = max(i + 1, int(np.searchsorted(starts, starts[i] + LINE_HASH_BLOCK_SIZE)))  # noqa: E501
+        if n < len(long_lines):
+            j = min(j, int(long_lines[n]))
+        lo, hi = starts[i], ends[j - 1]
+        terms = buf[lo:hi].astype(np.uint64)
+        line_starts = starts[i:j] - lo
+        line_ends = ends[i:j] - lo
+        h = (line_ends - line_starts).astype(np.uint64) * np.uint64(LINE_HASH_LENGTH_FACTOR)  # noqa: E501
+        for shift, modulus, (powers, inverses) in zip((32, 0), LINE_HASH_MODULI, tables):  # noqa: E501
+            m = np.uint64(modulus)
+            sums = np.zeros(hi - lo + 1, dtype=np.uint64)
+            np.cumsum(terms * powers[:hi - lo], out=sums[1:])  # 2**39未満の項の和なのであふれない  # noqa: E501
+            part = (sums[line_ends] - sums[line_starts]) % m * inverses[line_starts] % m  # noqa: E501
+            h ^= part << np.uint64(shift)
+        hashes[i:j] = _mix64(h)
+        i = j
+
+    result = array('Q')
+    result.frombytes(hashes.tobytes())
+    return result
+
+
+@lru_cache(maxsize=1)
+def _hash_powers():
+    """各法での基数とその逆数の0乗から(LINE_HASH_BLOCK_SIZE+LINE_HASH_MAX_LENGTH-1)乗までの配列
+    """
+    size = LINE_HASH_BLOCK_SIZE + LINE_HASH_MAX_LENGTH
+    tables = []
+    for base, modulus in zip(LINE_HASH_BASES, LINE_HASH_MODULI):
+        pair = []
+        for b in (base, pow(base, -1, modulus)):
+            table = np.empty(size, dtype=np.uint64)
+            table[0] = 1
+            step = 1
+            while step < size:  # 倍々に求める(p**2が2**64未満なので積はあふれない)
+                n = min(step, size - step)
+                table[step:step + n] = table[:n] * np.uint64(pow(b, step, modulus)) % np.uint64(modulus)  # noqa: E501
+                step += n
+            pair.append(table)
+        tables.append(pair)
+    return tables
+
+
+def _mix64(h):
+    """64ビットの値を撹拌する(splitmix64の最後の処理)
+    """
+    h = h ^ (h >> np.uint64(30))
+    h = h * np.uint64(0xBF58476D1CE4E5B9)
+    h = h ^ (h >> np.uint64(27))
+    h = h * np.uint64(0x94D049BB133111EB)
+    return h ^ (h >> np.uint64(31))
+
+
+def file_digest(path, use_mmap=False):
+    """ファイルのハッシュ値(BLAKE2)を取得する
+    """
+    h = hashlib.blake2b(digest_size=HASH_DIGEST_SIZE)
+    with open(path, 'rb') as f:
+        if use_mmap:
+            if os.fstat(f.fileno()).st_size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    view = memoryview(m)
+                    for i in range(0, len(view), HASH_CHUNK_SIZE):
+                        h.update(view[i:i+HASH_CHUNK_SIZE])
+                    view.release()
+        else:
+            for chunk in iter(partial(f.read, HASH_CHUNK_SIZE), b''):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def is_identical(pair, options):
+    """中身を比較する前に同一かどうかを判定する
+
+    サイズが違えば差分あり、サイズが同じならハッシュ値で判定する
+    """
+    left_stat, right_stat = pair.stats
+    if left_stat[0] != right_stat[0]:
+        return False
+    if options['quick_compare_by_date'] and left_stat[1] == right_stat[1]:
+        return True
+
+    for path, info in zip((pair.left, pair.right), pair.infos):
+        if info.digest is None:
+            info.digest = file_digest(path, options['hash_use_mmap'])
+    return pair.infos[0].digest == pair.infos[1].digest
+
+
+def load_info(path, info):
+    """エンコーディングと行ごとのハッシュ値が未取得ならファイルから求める
+    """
+    if info.encoding is None or (info.encoding != BINARY and info.line_hashes is None):  # noqa: E501
+        with open_buffer(path) as data:
+            if info.digest is None:
+                info.digest = hashlib.blake2b(data, digest_size=HASH_DIGEST_SIZE).hexdigest()  # noqa: E501
+            if is_binary(data):
+                info.encoding = BINARY
+            else:
+                info.encoding = detect_encoding(data)
+                info.line_hashes = line_hashes(to_utf8(data, info.encoding))
+    return info
+
+
+def _info_state(info):
+    """FileInfoのどこまで求まっているか(キャッシュから取得したままかどうかの判定用)
+    """
+    return info.digest, info.encoding, info.line_hashes is not None
+
+
+def compare_pair(pair, options=DEFAULT_OPTIONS):
+    """ファイルの組を比較する
+    """
+    if is_identical(pair, options):
+        pair.status = STATUS_IDENTICAL
+        return pair
+
+    left = load_info(pair.left, pair.infos[0])
+    right = load_info(pair.right, pair.infos[1])
+
+    if BINARY in (left.encoding, right.encoding):
+        pair.status = STATUS_BINARY
+        return pair
+
+    pair.opcodes = diff_opcodes(left.line_hashes, right.line_hashes, options['diff_max_cost'])  # noqa: E501
+    if options['detect_moves']:
+        pair.opcodes = find_moves(pair.opcodes, left.line_hashes, right.line_hashes)  # noqa: E501
+    if options['inline_diff']:
+        pair.opcodes = align_replaced(pair, options['inline_diff'])
+    pair.status = STATUS_CHANGED
+    return pair
+
+
+def align_replaced(pair, mode):
+    """置換の範囲ごとに似ている行を組にして編集操作を分け直す(align_lines())
+
+    置換の範囲の行だけをデコードし、行数の積が大きすぎる範囲は読み飛ばす
+    """
+    opcodes = []
+    left_encoding, right_encoding = pair.encodings
+    with open_buffer(pair.left) as left_data, open_buffer(pair.right) as right_data:  # noqa: E501
+        left_lines = LineReader(left_data, left_encoding)
+        right_lines = LineReader(right_data, right_encoding)
+        try:
+            for tag, i1, i2, j1, j2 in pair.opcodes:
+                if tag != OP_REPLACE or (i2 - i1) * (j2 - j1) > ALIGN_MAX_CELLS:  # noqa: E501
+                    left_lines.skip(i2 - i1)
+                    right_lines.skip(j2 - j1)
+                    opcodes.append((tag, i1, i2, j1, j2))
+                    continue
+                left = left_lines.read_lines(i2 - i1)
+                right = right_lines.read_lines(j2 - j1)
+                opcodes.extend(
+                    (op, i1 + ai1, i1 + ai2, j1 + aj1, j1 + aj2)
+                    for op, ai1, ai2, aj1, aj2 in align_lines(left, right, mode)  # noqa: E501
+                )
+        finally:
+            left_lines.close()
+            right_lines.close()
+    return opcodes
+
+
+def iter_diff_rows(pair, context=None, inline=None):
+    """差分シートの行を順に取得する
+
+    左右のファイルをmmapして先頭から順に行の位置をたどり、返す行だけをデコードする
+    contextを指定した場合は差分の前後context行より離れた一致行を1行にまとめ、
+    まとめた行はデコードしない(collapse_context()と同じ結果になる)
+    inlineを指定した場合は変更行の組に行内の差分の範囲を付ける('word', 'char')
+    """
+    left_encoding, right_encoding = pair.encodings
+    with open_buffer(pair.left) as left_data, open_buffer(pair.right) as right_data:  # noqa: E501
+        left_lines = LineReader(left_data, left_encoding)
+        right_lines = LineReader(right_data, right_encoding)
+        try:
+            for tag, i1, i2, j1, j2 in collapse_opcodes(pair.opcodes, context):
+                if tag == OP_SKIP:
+                    left_lines.skip(i2 - i1)
+                    right_lines.skip(j2 - j1)
+                    yield skip_row(((i1 + 1, i2), (j1 + 1, j2)))
+                    continue
+
+                if tag == OP_EQUAL:
+                    for i in range(i1, i2, READ_LINES):
+                        n = min(READ_LINES, i2 - i)
+                        j = j1 + i - i1
+                        for k, left, right in zip(range(n), left_lines.read_lines(n), right_lines.read_lines(n)):  # noqa: E501
+                            yield DiffRow(i+k+1, left, j+k+1, right, OP_EQUAL)
+                    continue
+
+                moved = tag in (OP_MOVED_FROM, OP_MOVED_TO)
+                for k in range(max(i2-i1, j2-j1)):
+                    i, j = i1 + k, j1 + k
+                    left = left_lines.read() if i < i2 else None
+                    right = right_lines.read() if j < j2 else None
+                    if i < i2 and j < j2:
+                        spans = inline_spans(left, right, inline) if inline else (None, None)  # noqa: E501
+                        yield DiffRow(i+1, left, j+1, right, OP_REPLACE, *spans)  # noqa: E501
+                    elif i < i2:
+                        yield DiffRow(i+1, left, None, None, tag if moved else OP_DELETE)  # noqa: E501
+                    else:
+                        yield DiffRow(None, None, j+1, right, tag if moved else OP_INSERT)  # noqa: E501
+        finally:
+            left_lines.close()
+            right_lines.close()
+
+
+class LineReader:
+    """mmapしたファイルの行を先頭から順に読む(読み飛ばす行はデコードしない)
+
+    UTF-16/32のファイルは先にUTF-8に変換して読む
+    """
+    def __init__(self, data, encoding):
+        if encoding in WIDE_ENCODINGS:
+            data, encoding = to_utf8(data, encoding), 'utf-8'
+        self.data = data
+        self.encoding = encoding
+        self.spans = line_spans(data)
+
+    def read(self):
+        """次の行を文字列で取得する
+        """
+        start, end = next(self.spans)
+        return self.data[start:end].decode(self.encoding)
+
+    def read_lines(self, n):
+        """次のn行を文字列のリストで取得する
+        """
+        data, encoding = self.data, self.encoding
+        return [data[start:end].decode(encoding) for start, end in islice(self.spans, n)]  # noqa: E501
+
+    def skip(self, n):
+        """n行読み飛ばす
+        """
+        next(islice(self.spans, n, n), None)
+
+    def close(self):
+        """行の位置の取得を終える(mmapを閉じる前に呼ぶ)
+        """
+        self.spans.close()
+
+
+def map_jobs(func, items, jobs=1, prefetch=0):
+    """itemsの各要素をfuncで処理し、結果を順番通りに返す
+
+    jobsが2以上の場合はプロセスプールで並列に処理する
+    prefetchを指定した場合は受け取られていない結果をprefetch件までに抑える(結果が大きい場合)
+    """
+    if jobs <= 1 or len(items) <= 1:
+        yield from map(func, items)
+        return
+
+    if prefetch:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = deque()
+            for item in items:
+                futures.append(executor.submit(func, item))
+                if len(futures) >= prefetch:
+                    yield futures.popleft().result()
+            while futures:
+                yield futures.popleft().result()
+        return
+
+    chunksize = max(1, min(MAX_CHUNKSIZE, len(items) // (jobs * 4)))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(func, items, chunksize=chunksize)
+
+
+class NativeEngine:
+    """フォルダ差分を取る
+    """
+    def __init__(self, base, latest, jobs=1, cache=None, **options):
+        self.base = Path(base)
+        self.latest = Path(latest)
+        self.jobs = jobs
+        self.cache = cache
+        self.options = {**DEFAULT_OPTIONS, **options}
+        self.pairs = []
+        self.cached = {}  # ファイルのパス -> キャッシュから取得した情報の状態
+
+    def compare(self):
+        """フォルダを比較する
+        """
+        self.pairs = self._collect_pairs()
+        if self.cache:
+            self._load_cache()
+
+        indexes = [i for i, pair in enumerate(self.pairs) if pair.status is None]  # noqa: E501
+        targets = [self.pairs[i] for i in indexes]
+        func = partial(compare_pair, options=self.options)
+        for i, pair in zip(indexes, map_jobs(func, targets, self.jobs)):
+            self.pairs[i] = pair
+
+        if self.cache:
+            self._save_cache()
+        return self.pairs
+
+    def _load_cache(self):
+        """キャッシュ済みの情報を取得し、ハッシュ値で同一と分かるものは確定させる
+        """
+        for pair in self.pairs:
+            if pair.status is None:
+                pair.infos = tuple(
+                    self.cache.get(path, stat) or FileInfo()
+                    for path, stat in zip((pair.left, pair.right), pair.stats)
+                )
+                self.cached.update(
+                    (path, _info_state(info))
+                    for path, info in zip((pair.left, pair.right), pair.infos)
+                )
+                left, right = pair.infos
+                if left.digest and left.digest == right.digest:
+                    pair.status = STATUS_IDENTICAL
+
+    def _save_cache(self):
+        """今回求めた情報をキャッシュに登録する(キャッシュから取得したままのものは除く)
+        """
+        for pair in self.pairs:
+            if pair.left and pair.right:
+                for path, stat, info in zip((pair.left, pair.right), pair.stats, pair.infos):  # noqa: E501
+                    if info.digest is not None and self.cached.get(path) != _info_state(info):  # noqa: E501
+                        self.cache.put(path, stat, info)
+                    info.line_hashes = None
+
+    def _collect_pairs(self):
+        """比較するファイルの組を集める
+        """
+        left_files = self._walk(self.base)
+        right_files = self._walk(self.latest)
+
+        pairs = []
+        for key in sorted(left_files.keys() | right_files.keys()):
+            folder, name = key
+            pair = FilePair(name, folder, left_files.get(key), right_files.get(key))  # noqa: E501
+            pair.stats = (_stat(pair.left), _stat(pair.right))
+            if pair.left:
+                pair.left_date = pair.stats[0][1] / 1e9
+            if pair.right:
+                pair.right_date = pair.stats[1][1] / 1e9
+            if not pair.right:
+                pair.status = STATUS_LEFT_ONLY
+            elif not pair.left:
+                pair.status = STATUS_RIGHT_ONLY
+            pairs.append(pair)
+        return pairs
+
+    def _walk(self, top):
+        """フォルダ配下のファイルを取得する
+        """
+        files = {}
+        for root, dirs, names in os.walk(top):
+            dirs.sort()
+            folder = os.path.relpath(root, top)
+            folder = '' if folder == os.curdir else folder.replace(os.sep, '\\')  # noqa: E501
+            for name in names:
+                files[(folder, name)] = os.path.join(root, name)
+        return files
+
+    def write_html(self, output_html, output_html_files, skip=(), context_lines=None):  # noqa: E501
+        """WinMergeと同じ形式のhtmlレポートを出力する
+
+        skipに含まれる(相対パスの)ファイルの組のファイル比較レポートは出力しない
+        context_linesを指定した場合は差分の前後その行数だけ一致行を出力する
+        行内の差分はWinMergeと同様に文字色を変えたspanで出力する
+        """
+        output_html = Path(output_html)
+        output_html_files = Path(output_html_files)
+        output_html_files.mkdir(parents=True, exist_ok=True)
+
+        report_names = plan_report_names(self.pairs)
+        with open(output_html, 'w', encoding='utf-8') as f:
+            write_summary_html(f, self.base, self.latest, self.pairs, output_html_files.name, report_names)  # noqa: E501
+
+        for pair in self.pairs:
+            if pair.has_report and pair.rel_path not in skip:
+                html_file = output_html_files / (report_names[pair.rel_path] + '.html')  # noqa: E501
+                self.write_diff_html(html_file, pair, context_lines)
+
+    def write_diff_html(self, html_file, pair, context_lines=None):
+        """ファイルの組1つのファイル比較のhtmlレポートを出力する
+        """
+        with open(html_file, 'w', encoding='utf-8') as f:
+            self._write_diff_html(f, pair, context_lines)
+
+    def _write_diff_html(self, f, pair, context_lines=None):
+        """ファイル比較のhtmlレポートを出力する
+        """
+        f.write(HTML_HEADER)
+        f.write(f'<tr><th></th><th>{_escape(str(pair.left))}</th><th></th><th>{_escape(str(pair.right))}</th></tr>\n')  # noqa: E501
+        for row in iter_diff_rows(pair, context_lines, self.options['inline_diff']):  # noqa: E501
+            f.write('<tr>')
+            f.write(_no_cell(row.left_no))
+            f.write(_code_cell(row.left_text, row.op, row.left_spans))
+            f.write(_no_cell(row.right_no))
+            f.write(_code_cell(row.right_text, row.op, row.right_spans))
+            f.write('</tr>\n')
+        f.write(HTML_FOOTER)
+
+
+HTML_HEADER = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="UTF-8">
+<title>WinMerge File Compare Report</title>
+<style>td.code {mso-number-format:"\\@"; white-space: pre;}</style>
+</head>
+<body>
+<table>
+'''
+
+HTML_FOOTER = '''</table>
+</body>
+</html>
+'''
+
+
+def write_summary_html(f, base, latest, pairs, files_dir, report_names):
+    """WinMergeと同じ形式の一覧のhtmlレポートを出力する
+
+    files_dirはファイル比較レポートのフォルダの(一覧のhtmlからの)相対パス、
+    report_namesはファイルの組の相対パスからファイル比較レポートのファイル名への対応
+    """
+    f.write(HTML_HEADER)
+    f.write(f'<tr><td colspan="6">Compare {_escape(str(base))} with {_escape(str(latest))}</td></tr>\n')  # noqa: E501
+    f.write(f'<tr><td colspan="6">{datetime.now().strftime(DATE_FORMAT)}</td></tr>\n')  # noqa: E501
+    f.write('<tr><td></td></tr>\n')
+    f.write('<tr><td></td></tr>\n')
+    f.write('<tr><th>Filename</th><th>Folder</th><th>Comparison result</th><th>Left Date</th><th>Right Date</th><th>Extension</th></tr>\n')  # noqa: E501
+    for pair in pairs:
+        name = _escape(pair.name)
+        if pair.rel_path in report_names:
+            name = f'<a href="{files_dir}/{_escape(report_names[pair.rel_path])}.html">{name}</a>'  # noqa: E501
+        status = pair.status_text or STATUS_TEXTS[pair.status]
+        f.write(
+            f'<tr><td>{name}</td>'
+            f'<td>{_escape(pair.folder)}</td>'
+            f'<td>{_escape(status)}</td>'
+            f'<td>{format_date(pair.left_date)}</td>'
+            f'<td>{format_date(pair.right_date)}</td>'
+            f'<td>{_escape(Path(pair.name).suffix[1:])}</td></tr>\n'
+        )
+    f.write(HTML_FOOTER)
+
+
+def _escape(text):
+    """htmlのエスケープ
+    """
+    return html.escape(text, quote=True)
+
+
+def _stat(path):
+    """ファイルの(サイズ, 更新日時[ns], inode)を取得する
+    """
+    if path is None:
+        return None
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns, st.st_ino
+
+
+def _no_cell(no):
+    """行番号のセル
+    """
+    return f'<td>{no}</td>' if no else '<td></td>'
+
+
+def _code_cell(text, op, spans=None):
+    """ソースコードのセル(spansの範囲は文字色を変える)
+    """
+    color = DIFF_COLORS['blank'] if text is None else DIFF_COLORS[op]
+    text, spans = expand_tabs(text or '', spans)
+    parts = []
+    pos = 0
+    for start, end in spans or ():
+        parts.append(_code_text(text[pos:start]))
+        parts.append(f'<span style="color:#{INLINE_COLOR}">{_code_text(text[start:end])}</span>')  # noqa: E501
+        pos = end
+    parts.append(_code_text(text[pos:]))
+    return f'<td class="code" style="background-color:#{color}">{"".join(parts)}</td>'  # noqa: E501
+
+
+def _code_text(text):
+    """ソースコードのセルの文字列(空白は&nbsp;にする)
+    """
+    return _escape(text).replace(' ', '&nbsp;')
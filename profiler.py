@@ -0,0 +1,146 @@
+"""処理ごとの時間と回数を計測する
+"""
+import os
+import json
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+PRIMITIVE_TYPES = (type(None), bool, int, float, str, bytes, tuple, list, dict)  # COMの戻り値でラップしない型  # noqa: E501
+
+
+class Profiler:
+    """処理(フェーズ)ごとの経過時間と回数(COM呼び出し, 行数, 読み込んだバイト数など)を記録する
+
+    フェーズは入れ子にでき、各フェーズにはその間に増えた回数を記録する
+    """
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.counters = Counter()
+        self.phases = []
+        self.depth = 0
+
+    @contextmanager
+    def phase(self, name, **args):
+        """withの間をフェーズとして計測する
+        """
+        start = time.perf_counter()
+        before = self.counters.copy()
+        self.depth += 1
+        try:
+            yield
+        finally:
+            self.depth -= 1
+            end = time.perf_counter()
+            counts = self.counters - before
+            self.phases.append({
+                'name': name,
+                'depth': self.depth,
+                'start': start - self.origin,
+                'duration': end - start,
+                'args': args,
+                'counts': dict(counts),
+            })
+
+    def count(self, name, n=1):
+        """回数を加算する
+        """
+        self.counters[name] += n
+
+    def count_file_size(self, name, path):
+        """ファイルのサイズを加算する
+        """
+        if path is not None and os.path.exists(path):
+            self.counters[name] += os.path.getsize(path)
+
+    def to_json(self):
+        """計測結果
+        """
+        return {
+            'total': time.perf_counter() - self.origin,
+            'counters': dict(sorted(self.counters.items())),
+            'phases': sorted(self.phases, key=lambda phase: phase['start']),
+        }
+
+    def write_json(self, path):
+        """計測結果をJSONで出力する
+        """
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_json(), f, ensure_ascii=False, indent=1)
+
+    def write_chrome_trace(self, path):
+        """計測結果をChromeのトレースイベント形式(chrome://tracing, Perfetto)で出力する
+        """
+        pid = os.getpid()
+        events = []
+        for phase in sorted(self.phases, key=lambda phase: phase['start']):
+            events.append({
+                'name': phase['name'],
+                'ph': 'X',
+                'ts': phase['start'] * 1e6,
+                'dur': phase['duration'] * 1e6,
+                'pid': pid,
+                'tid': 0,
+                'args': {**phase['args'], **phase['counts']},
+            })
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)  # noqa: E501
+
+
+def profiled(method):
+    """メソッド全体を1つのフェーズとして計測する(self.profilerを使う)
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.profiler.phase(method.__name__):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class ComProxy:
+    """COMオブジェクトへの呼び出し回数をAPIごとに数えるためのラッパー
+
+    プロパティの取得はcom.名前, 設定はcom.名前=, 呼び出しはcom.名前(),
+    反復はcom.名前[]として数え、戻り値のCOMオブジェクトも同様にラップする
+    """
+    __slots__ = ('_obj', '_profiler', '_name')
+
+    def __init__(self, obj, profiler, name='Application'):
+        object.__setattr__(self, '_obj', obj)
+        object.__setattr__(self, '_profiler', profiler)
+        object.__setattr__(self, '_name', name)
+
+    def __getattr__(self, name):
+        self._profiler.count('com.' + name)
+        return self._wrap(getattr(self._obj, name), name)
+
+    def __setattr__(self, name, value):
+        self._profiler.count('com.' + name + '=')
+        setattr(self._obj, name, unwrap(value))
+
+    def __call__(self, *args, **kwargs):
+        self._profiler.count('com.' + self._name + '()')
+        args = [unwrap(arg) for arg in args]
+        kwargs = {key: unwrap(value) for key, value in kwargs.items()}
+        return self._wrap(self._obj(*args, **kwargs), self._name)
+
+    def __iter__(self):
+        for item in self._obj:
+            self._profiler.count('com.' + self._name + '[]')
+            yield self._wrap(item, self._name)
+
+    def _wrap(self, value, name):
+        """戻り値がCOMオブジェクトであればラップする
+        """
+        if isinstance(value, PRIMITIVE_TYPES):
+            return value
+        return ComProxy(value, self._profiler, name)
+
+
+def unwrap(value):
+    """ComProxyであれば元のCOMオブジェクトを取り出す
+    """
+    if isinstance(value, ComProxy):
+        return object.__getattribute__(value, '_obj')
+    return value
@@ -0,0 +1,268 @@
+"""WinMergeのhtmlレポートを読み込む
+"""
+import re
+from datetime import datetime
+from html.parser import HTMLParser
+from pathlib import Path
+from urllib.parse import unquote
+
+from diff_model import (
+    FilePair, DiffRow, DATE_FORMAT, changed_groups, collapse_context,
+    STATUS_IDENTICAL, STATUS_CHANGED, STATUS_LEFT_ONLY, STATUS_RIGHT_ONLY,
+    STATUS_BINARY, STATUS_OTHER, OP_EQUAL, OP_REPLACE, OP_DELETE, OP_INSERT,
+)
+
+READ_SIZE = 64 * 1024  # 1度に読み込むサイズ
+WHITE = 'FFFFFF'       # 差分がないセルの背景色
+
+STATUS_KEYWORDS = (    # 比較結果の表示から判定する(上から順に調べる)
+    ('left only', STATUS_LEFT_ONLY),
+    ('左側のみ', STATUS_LEFT_ONLY),
+    ('right only', STATUS_RIGHT_ONLY),
+    ('右側のみ', STATUS_RIGHT_ONLY),
+    ('binary', STATUS_BINARY),
+    ('バイナリ', STATUS_BINARY),
+    ('identical', STATUS_IDENTICAL),
+    ('同一', STATUS_IDENTICAL),
+)
+
+DATE_FORMATS = (DATE_FORMAT, '%Y-%m-%d %H:%M:%S', '%m/%d/%Y %I:%M:%S %p')  # 日時の表示形式  # noqa: E501
+
+_CSS_RULE = re.compile(r'\.([\w-]+)\s*\{([^}]*)\}')
+_CSS_COLOR = re.compile(r'(background-color|background|color)\s*:\s*#([0-9a-fA-F]{6})')  # noqa: E501
+
+
+def parse_status(text, has_report=False):
+    """比較結果の表示から比較結果を判定する
+
+    どのキーワードにも当たらない表示は、ファイル比較レポートがあればテキストの差分、
+    なければその他(フォルダの差分, エラーなど)とする
+    """
+    lower = text.lower()
+    for keyword, status in STATUS_KEYWORDS:
+        if keyword in lower:
+            return status
+    return STATUS_CHANGED if has_report else STATUS_OTHER
+
+
+def parse_date(text):
+    """日時の表示からタイムスタンプを取得する
+    """
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text.strip(), date_format).timestamp()
+        except ValueError:
+            pass
+    return None
+
+
+def parse_style(style, classes=None, css=None):
+    """style属性とclass属性から(背景色, 文字色)を取得する
+    """
+    colors = {}
+    for name in (classes or '').split():
+        colors.update((css or {}).get(name, {}))
+    for prop, color in _CSS_COLOR.findall(style or ''):
+        colors['color' if prop == 'color' else 'background'] = color.upper()
+    return colors.get('background'), colors.get('color')
+
+
+class TableParser(HTMLParser):
+    """htmlの表を1行ずつ読み込む
+
+    行ごとに(見出し行かどうか, セルのリスト)をrowsにためる
+    セルは文字列, ハイパーリンク先, 背景色, 色付きの文字の範囲を持つ
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows = []
+        self.css = {}
+        self.in_style = False
+        self.style_text = []
+        self.cells = None
+        self.header = False
+        self.cell = None
+        self.spans = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'style':
+            self.in_style = True
+        elif tag == 'tr':
+            self.cells = []
+            self.header = False
+        elif tag in ('td', 'th') and self.cells is not None:
+            self.header |= tag == 'th'
+            background, _ = parse_style(attrs.get('style'), attrs.get('class'), self.css)  # noqa: E501
+            background = background or (attrs.get('bgcolor') or '').lstrip('#').upper() or None  # noqa: E501
+            self.cell = {'text': [], 'href': None, 'background': background, 'spans': []}  # noqa: E501
+        elif self.cell is not None:
+            if tag == 'a' and attrs.get('href'):
+                self.cell['href'] = attrs['href']
+            elif tag in ('span', 'font'):
+                background, color = parse_style(attrs.get('style'), attrs.get('class'), self.css)  # noqa: E501
+                color = color or (attrs.get('color') or '').lstrip('#').upper() or None  # noqa: E501
+                highlighted = bool(color) or (background and background != self.cell['background'])  # noqa: E501
+                self.spans.append((self._text_length(), highlighted))
+            elif tag == 'br':
+                self.cell['text'].append('\n')
+
+    def handle_endtag(self, tag):
+        if tag == 'style':
+            self.in_style = False
+            self._parse_css(''.join(self.style_text))
+        elif tag in ('span', 'font') and self.cell is not None and self.spans:
+            start, highlighted = self.spans.pop()
+            end = self._text_length()
+            if highlighted and end > start:
+                self.cell['spans'].append((start, end))
+        elif tag in ('td', 'th') and self.cell is not None:
+            self.cell['text'] = ''.join(self.cell['text']).replace('\xa0', ' ')
+            self.cells.append(self.cell)
+            self.cell = None
+            self.spans = []
+        elif tag == 'tr' and self.cells is not None:
+            self.rows.append((self.header, self.cells))
+            self.cells = None
+
+    def handle_data(self, data):
+        if self.in_style:
+            self.style_text.append(data)
+        elif self.cell is not None:
+            self.cell['text'].append(data)
+
+    def _text_length(self):
+        """セル内のこれまでの文字数
+        """
+        return sum(len(text) for text in self.cell['text'])
+
+    def _parse_css(self, text):
+        """スタイルシートからクラスごとの色を取得する
+        """
+        for name, body in _CSS_RULE.findall(text):
+            colors = {}
+            for prop, color in _CSS_COLOR.findall(body):
+                colors['color' if prop == 'color' else 'background'] = color.upper()  # noqa: E501
+            if colors:
+                self.css[name] = colors
+
+
+def iter_table_rows(path):
+    """htmlファイルの表を1行ずつ取得する
+    """
+    parser = TableParser()
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        while True:
+            chunk = f.read(READ_SIZE)
+            if not chunk:
+                break
+            parser.feed(chunk)
+            yield from parser.rows
+            parser.rows = []
+    parser.close()
+    yield from parser.rows
+
+
+def parse_summary(path, base=None, latest=None):
+    """一覧のhtmlレポートからファイルの組を順に取得する
+    """
+    path = Path(path)
+    started = False
+    for header, cells in iter_table_rows(path):
+        if header:
+            started = True
+            continue
+        if not started or len(cells) < 3:
+            continue
+
+        name = cells[0]['text'].strip()
+        folder = cells[1]['text'].strip()
+        if not name:
+            continue
+        relpath = Path(folder.replace('\\', '/'), name) if folder else Path(name)  # noqa: E501
+        pair = FilePair(
+            name, folder,
+            Path(base, relpath) if base else None,
+            Path(latest, relpath) if latest else None,
+        )
+        pair.status_text = cells[2]['text'].strip()
+        pair.status = parse_status(pair.status_text, bool(cells[0]['href']))
+        if len(cells) >= 5:
+            pair.left_date = parse_date(cells[3]['text'])
+            pair.right_date = parse_date(cells[4]['text'])
+        if cells[0]['href']:
+            pair.report = path.parent / unquote(cells[0]['href'])
+        yield pair
+
+
+class DiffReport:
+    """ファイル比較のhtmlレポート
+
+    反復すると差分シートの行(DiffRow)を順に返す
+    left, rightは見出し行のファイルパスで、最初の行を返す前に設定される
+    """
+    def __init__(self, path):
+        self.path = path
+        self.left = None
+        self.right = None
+
+    def __iter__(self):
+        for header, cells in iter_table_rows(self.path):
+            if len(cells) < 4:
+                continue
+            if header:
+                self.left = cells[1]['text'].strip()
+                self.right = cells[3]['text'].strip()
+                continue
+            yield self._to_row(cells)
+
+    def _to_row(self, cells):
+        """表の1行を差分シートの行に変換する
+        """
+        left_no = _parse_no(cells[0]['text'])
+        right_no = _parse_no(cells[2]['text'])
+        left_text = cells[1]['text'] if left_no else None
+        right_text = cells[3]['text'] if right_no else None
+
+        changed = any(
+            cell['background'] and cell['background'] != WHITE
+            for cell in (cells[1], cells[3])
+        )
+        if left_text is None:
+            op = OP_INSERT
+        elif right_text is None:
+            op = OP_DELETE
+        elif changed:
+            op = OP_REPLACE
+        else:
+            op = OP_EQUAL
+        return DiffRow(
+            left_no, left_text, right_no, right_text, op,
+            cells[1]['spans'] or None, cells[3]['spans'] or None,
+        )
+
+
+def iter_report_rows(pair):
+    """WinMergeのファイル比較レポートから差分シートの行を順に取得する
+    """
+    return iter(DiffReport(pair.report))
+
+
+def parse_report(path, context_lines=None):
+    """ファイル比較レポートから差分シートの行のリストを取得する(並列処理用)
+    """
+    return list(collapse_context(DiffReport(path), context_lines))
+
+
+def parse_report_groups(path, context_lines=None):
+    """ファイル比較レポートから差分がある行のまとまりと行数を取得する(並列処理用)
+    """
+    ops = [row.op for row in collapse_context(DiffReport(path), context_lines)]  # noqa: E501
+    return changed_groups(ops), len(ops)
+
+
+def _parse_no(text):
+    """行番号を取得する(無ければNone)
+    """
+    text = text.strip()
+    return int(text) if text.isdigit() else None
@@ -0,0 +1,159 @@
+"""フォルダを分割してWinMergeを並列に実行する
+"""
+import os
+import asyncio
+import shutil
+from pathlib import Path
+
+from diff_model import plan_report_names
+from report_parser import parse_summary
+
+RECURSIVE_OPTION = '/r'  # すべてのサブフォルダ内のすべてのファイルを比較
+
+
+class Shard:
+    """WinMergeを1回実行する範囲
+    """
+    __slots__ = (
+        'index',      # 番号(出力するレポートの名前に使う)
+        'folder',     # 比較元(先)フォルダからの相対フォルダ
+        'recursive',  # サブフォルダも比較するかどうか
+        'excluded',   # 別の範囲で比較するサブフォルダ名(サブフォルダを比較しない場合)
+    )
+
+    def __init__(self, index, folder, recursive, excluded=()):
+        self.index = index
+        self.folder = folder
+        self.recursive = recursive
+        self.excluded = excluded
+
+    @property
+    def prefix(self):
+        """一覧に表示するフォルダの先頭に付けるフォルダ(WinMergeと同じく区切りは\\)
+        """
+        return '\\'.join(self.folder.parts)
+
+
+def plan_shards(base, latest, depth=1):
+    """比較元(先)の両方にあるdepth階層目のサブフォルダごとに範囲を分ける
+
+    それより浅い階層のファイルはフォルダごとにサブフォルダを比較しない範囲とする
+    片側にしかないサブフォルダはその親の範囲で比較する
+    """
+    shards = []
+
+    def plan(folder, depth):
+        shared = _subfolders(base / folder) & _subfolders(latest / folder)
+        names = sorted(shared, key=str.lower)
+        shards.append(Shard(len(shards), folder, False, frozenset(names)))
+        for name in names:
+            if depth > 1:
+                plan(folder / name, depth - 1)
+            else:
+                shards.append(Shard(len(shards), folder / name, True))
+
+    plan(Path(), depth)
+    return shards
+
+
+def _subfolders(path):
+    """サブフォルダ名の集合
+    """
+    try:
+        return {entry.name for entry in os.scandir(path) if entry.is_dir()}
+    except FileNotFoundError:
+        return set()
+
+
+class ShardedWinMerge:
+    """フォルダを分割してWinMergeを並列に実行し、結果を1つにまとめる
+
+    各範囲のレポートはwork_dirに出力し、まとめた後にファイル比較レポートを
+    output_html_filesへ移動する
+    """
+    def __init__(self, exe, options, base, latest, work_dir, concurrency, depth=1):  # noqa: E501
+        self.exe = exe
+        self.options = list(options)
+        self.base = Path(base)
+        self.latest = Path(latest)
+        self.work_dir = Path(work_dir)
+        self.concurrency = max(1, concurrency)
+        self.depth = max(1, depth)
+        self.shards = []
+
+    def run(self):
+        """各範囲でWinMergeを実行する
+        """
+        self.shards = plan_shards(self.base, self.latest, self.depth)
+        if self.work_dir.exists():
+            shutil.rmtree(self.work_dir)
+        self.work_dir.mkdir(parents=True)
+        asyncio.run(self._run_all())
+
+    async def _run_all(self):
+        """同時にconcurrency個までWinMergeを起動する
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(*(self._run(shard, semaphore) for shard in self.shards))  # noqa: E501
+
+    async def _run(self, shard, semaphore):
+        """1つの範囲でWinMergeを実行する
+        """
+        command = self.command(shard)
+        async with semaphore:
+            print(' '.join(command))
+            process = await asyncio.create_subprocess_exec(*command)
+            await process.wait()
+
+    def command(self, shard):
+        """WinMergeのコマンドライン
+        """
+        options = self.options
+        if not shard.recursive:
+            options = [option for option in options if option.lower() != RECURSIVE_OPTION]  # noqa: E501
+        return [
+            self.exe,
+            str(self.base / shard.folder),
+            str(self.latest / shard.folder),
+            *options,
+            str(self.summary_html(shard)),
+        ]
+
+    def summary_html(self, shard):
+        """範囲ごとの一覧のhtmlレポートのパス
+        """
+        return self.work_dir / f'{shard.index}.html'
+
+    def merge(self, output_html_files):
+        """各範囲の一覧を1つにまとめ、ファイル比較レポートをoutput_html_filesへ移動する
+
+        フォルダは比較元(先)フォルダからの相対フォルダに直す
+        """
+        output_html_files = Path(output_html_files)
+        output_html_files.mkdir(parents=True, exist_ok=True)
+        pairs = []
+        for shard in self.shards:
+            summary_html = self.summary_html(shard)
+            if not summary_html.exists():
+                print(f'- {summary_html} not found (skipped)')
+                continue
+            for pair in parse_summary(summary_html, self.base / shard.folder, self.latest / shard.folder):  # noqa: E501
+                if not shard.recursive and not pair.folder and pair.name in shard.excluded:  # noqa: E501
+                    continue  # 別の範囲で比較したサブフォルダ
+                if shard.prefix:
+                    pair.folder = shard.prefix + '\\' + pair.folder if pair.folder else shard.prefix  # noqa: E501
+                pairs.append(pair)
+        report_names = plan_report_names(pairs)
+        for pair in pairs:
+            if pair.report is not None:
+                pair.report = self._move_report(pair, output_html_files / (report_names[pair.rel_path] + '.html'))  # noqa: E501
+        shutil.rmtree(self.work_dir)
+        return pairs
+
+    def _move_report(self, pair, dst):
+        """ファイル比較レポートを一覧をまとめた後の名前(dst)で移動する
+        """
+        if not pair.report.exists():
+            return None
+        os.replace(pair.report, dst)
+        return dst
@@ -4,11 +4,55 @@ import shutil
 from pathlib import Path
 import subprocess
 import json
-import win32com.client
+import itertools
+from functools import partial
+
+try:
+    import win32com.client
+except ImportError:  # Windows以外の環境
+    win32com = None
+
+from diff_model import (
+    STATUS_IDENTICAL, OP_MOVED_TO, MOVED_TEXT, plan_sheet_names,
+    plan_report_names,
+    changed_groups, moved_groups, collapse_context,
+)
+from native_engine import (
+    NativeEngine, LINE_HASH, file_digest, iter_diff_rows, map_jobs,
+    write_summary_html,
+)
+from hash_cache import HashCache
+from report_parser import (
+    parse_summary, iter_report_rows, parse_report, parse_report_groups,
+)
+from xlsx_writer import (
+    XlsxReportWriter, SUMMARY_SHEET_NAME, plan_books, read_linked_books,
+)
+from winmerge_shards import ShardedWinMerge
+from profiler import Profiler, ComProxy, profiled
+from fake_excel import FakeExcel, com_error
 
 VERSION = 'v1.0.0'
 
+ENGINE = 'winmerge'                      # 差分エンジン('winmerge' : WinMerge, 'native' : 内蔵)  # noqa: E501
+BACKEND = 'com'                          # xlsxの出力方法('com' : Excel, 'xlsx' : 直接出力)  # noqa: E501
+XLSX_SHARED_STRINGS = 65536              # 直接出力で共有する文字列の上限数(0 : 共有しない)
+OUTPUT_SPLIT_BY_FOLDER = False           # 直接出力で差分シートを最上位のフォルダごとに別のブックに分ける
+OUTPUT_MAX_SHEETS = 0                    # 直接出力で1つのブックに入れる差分シートの上限数(0 : 上限なし)
+OUTPUT_MAX_BYTES = 0                     # 直接出力で1つのブックに入れる比較ファイルの合計サイズの上限(0 : 上限なし)  # noqa: E501
+EXCEL_PERFORMANCE_MODE = True            # Excelの画面更新などを止めて変換する
+EXCEL_APPLICATION = 'excel'              # 変換に使うExcel('excel' : Excel, 'fake' : メモリ上の代用品)  # noqa: E501
+QUICK_COMPARE_BY_DATE = False            # 内蔵エンジンでサイズと更新日時が同じファイルを同一とみなす
+HASH_USE_MMAP = False                    # 内蔵エンジンのハッシュ計算にmmapを使う
+DIFF_MAX_COST = 1024                     # 内蔵エンジンの行差分で調べる編集距離の上限(超えた範囲は少しずつ先へ進めて比較する)  # noqa: E501
+INLINE_DIFF = 'word'                     # 内蔵エンジンの行内の差分の単位('word' : 単語, 'char' : 文字, None : 求めない)  # noqa: E501
+DETECT_MOVES = True                      # 内蔵エンジンで削除した行と同じ並びの追加した行を移動とみなす
+HASH_CACHE = True                        # 内蔵エンジンのハッシュ値を次回以降に再利用する
+HASH_CACHE_MAX_BYTES = 256 * 1024 * 1024  # ハッシュ値のキャッシュの上限サイズ
+
 WINMERGE_EXE = r'C:\Program Files\WinMerge\WinMergeU.exe'  # WinMergeへのパス
+WINMERGE_SHARDS = 0       # サブフォルダごとに分けて同時に起動するWinMergeの数(0, 1 : 分けない)
+WINMERGE_SHARD_DEPTH = 1  # 分けるサブフォルダの階層
 WINMERGE_OPTIONS = [
     '/minimize',                             # ウィンドウ最小化で起動
     '/noninteractive',                       # レポート出力後に終了
@@ -32,6 +76,7 @@ xlToLeft = -4159
 xlOpenXMLWorkbook = 51
 xlCenter = -4108
 xlContinuous = 1
+xlCalculationManual = -4135
 
 SUMMARY_WS_NUM = 1        # 一覧シートのワークシート番号
 SUMMARY_START_ROW = 6     # 一覧シートの表の開始行
@@ -40,8 +85,19 @@ SUMMARY_FOLDER_COL = 'B'  # 一覧シートの表のフォルダー列
 
 HOME_POSITION = 'A1'  # ホームポジション
 
+MAX_ADDRESS_LENGTH = 255  # Rangeに渡すアドレスの最大長
+
+EXCEL_APPLICATIONS = {  # Excel.Applicationを作成する関数
+    'excel': lambda: win32com.client.Dispatch('Excel.Application'),
+    'fake': FakeExcel,
+}
+
+REPORT_PREFETCH = 2  # 並列処理で先に読み込んでおくファイル比較レポートの数(並列数あたり)
+
 DIFF_START_ROW = 2                                            # 差分シートの開始行
 DIFF_ZOOM_RATIO = 85                                          # 差分シートのズームの倍率
+DIFF_MAX_ROWS = 1048576 - DIFF_START_ROW                      # 差分シート1枚の最大行数(超える分は続きのシートへ)  # noqa: E501
+CONTEXT_LINES = None                                          # 差分の前後に表示する一致行の数(None : 全て表示)  # noqa: E501
 DIFF_FORMATS = {                                              # 差分シートの書式設定
     'no': [                                                   # 行番号列
         {'col': 'A', 'width': 5},                             # 左側
@@ -56,53 +112,130 @@ DIFF_FORMATS = {                                              # 差分シート
     ],
 }
 
+SETTING_KEYS = (  # setting.jsonで変更できる設定
+    'WINMERGE_EXE',
+    'WINMERGE_OPTIONS',
+    'WINMERGE_SHARDS',
+    'WINMERGE_SHARD_DEPTH',
+    'DIFF_FORMATS',
+    'DIFF_MAX_ROWS',
+    'CONTEXT_LINES',
+    'ENGINE',
+    'BACKEND',
+    'XLSX_SHARED_STRINGS',
+    'OUTPUT_SPLIT_BY_FOLDER',
+    'OUTPUT_MAX_SHEETS',
+    'OUTPUT_MAX_BYTES',
+    'EXCEL_PERFORMANCE_MODE',
+    'EXCEL_APPLICATION',
+    'QUICK_COMPARE_BY_DATE',
+    'HASH_USE_MMAP',
+    'DIFF_MAX_COST',
+    'INLINE_DIFF',
+    'DETECT_MOVES',
+    'HASH_CACHE',
+    'HASH_CACHE_MAX_BYTES',
+)
+
+MANIFEST_KEYS = (  # 差分シートの中身が変わる設定(前回と異なれば差分更新でもシートを作り直す)
+    'ENGINE',
+    'BACKEND',
+    'CONTEXT_LINES',
+    'DIFF_MAX_ROWS',
+    'INLINE_DIFF',
+    'DETECT_MOVES',
+)
+
+
+def iter_rows(pair):
+    """ファイルの組の差分シートの行を順に取得する(CONTEXT_LINESに応じて一致行を省略する)
+
+    内蔵エンジンの場合はINLINE_DIFFに応じて行内の差分の範囲を付ける
+    """
+    if pair.report is None:
+        return iter_diff_rows(pair, CONTEXT_LINES, INLINE_DIFF)
+    return collapse_context(iter_report_rows(pair), CONTEXT_LINES)
+
 
 class WinMergeXlsx:
     """WinMergeの差分レポートをエクセルに出力
     """
-    def __init__(self, base, latest, output='./output.xlsx'):
+    def __init__(self, base, latest, output='./output.xlsx', jobs=1, incremental=False):  # noqa: E501
         self.base = Path(base).absolute()
         self.latest = Path(latest).absolute()
         self.output = Path(output).absolute()
+        self.jobs = jobs if jobs > 0 else os.cpu_count()
+        self.incremental = incremental
 
         parent = str(self.output.parent)
         stem = str(self.output.stem)
         self.output_html = Path(parent + '/' + stem + '.html')
         self.output_html_files = Path(parent + '/' + stem + '.files')
+        self.output_cache = Path(parent + '/' + stem + '.cache')
+        self.output_prev = Path(parent + '/' + stem + '.prev.xlsx')
+        self.output_manifest = Path(parent + '/' + stem + '.manifest.json')
+        self.output_shards = Path(parent + '/' + stem + '.shards')
 
         self.setting_json = './setting.json'
         if os.path.exists(self.setting_json):
-            with open(self.setting_json, 'r') as f:
-                json_load = json.load(f)
-            if 'WINMERGE_EXE' in json_load:
-                global WINMERGE_EXE
-                WINMERGE_EXE = json_load['WINMERGE_EXE']
-            if 'WINMERGE_OPTIONS' in json_load:
-                global WINMERGE_OPTIONS
-                WINMERGE_OPTIONS = json_load['WINMERGE_OPTIONS']
-            if 'DIFF_FORMATS' in json_load:
-                global DIFF_FORMATS
-                DIFF_FORMATS = json_load['DIFF_FORMATS']
-
-        self.sheet_memo = {}
-        self.sheet_count = {}
+            json_load = self._load_setting_json()
+            for key in SETTING_KEYS:
+                if key in json_load:
+                    globals()[key] = json_load[key]
+
+        self.pairs = []
+        self.engine = None       # 内蔵エンジン(ファイル比較レポートを作り直すときに使う)
+        self.report_names = None  # 相対パス -> ファイル比較レポートのファイル名(内蔵エンジン)
+        self.pair_reports = {}   # 相対パス -> ファイルの組(ファイル比較レポートがあるもの)
+        self.manifest = {}       # 前回の相対パス -> シート名, ハッシュ値
+        self.sheet_sources = {}  # シート名 -> 相対パス, ハッシュ値
+        self.carried = {}        # 前回から引き継ぐシート名 -> 前回のシート名
+        self.sheet_pairs = {}    # シート名 -> ファイルの組
+        self.prev_wb = None
+        self.excel_states = {}
+        self.report_groups = {}  # シート名 -> 差分がある行のまとまり, 行数(並列で読み込んだ分)
+        self.profiler = Profiler()
+
+    def _load_setting_json(self):
+        """設定ファイルを読み込む(UTF-8で読めなければShift_JISとして読む)
+        """
+        with open(self.setting_json, 'rb') as f:
+            data = f.read()
+        try:
+            return json.loads(data.decode('utf-8-sig'))
+        except UnicodeDecodeError:
+            return json.loads(data.decode('cp932'))
 
     def generate(self):
         """レポート生成
         """
         self._setup()
-        self._generate_html_by_winmerge()
-        self._convert_html_to_xlsx()
-
+        if ENGINE == 'native':
+            self._generate_html_by_native()
+        else:
+            self._generate_html_by_winmerge()
+        if BACKEND == 'xlsx':
+            self._write_xlsx()
+        else:
+            self._convert_html_to_xlsx()
+
+    @profiled
     def _setup(self):
         """準備
         """
-        self._setup_excel_application()
+        if BACKEND != 'xlsx':
+            self._setup_excel_application()
         self._setup_output_files()
 
     def _setup_excel_application(self):
         """エクセルアプリケーションの準備
         """
+        if EXCEL_APPLICATION not in EXCEL_APPLICATIONS:
+            self.__message_and_exit(f'EXCEL_APPLICATION : {EXCEL_APPLICATION} は使えません。')  # noqa: E501
+        if EXCEL_APPLICATION != 'excel':
+            return
+        if win32com is None:
+            self.__message_and_exit('pywin32(win32com)が見つかりません。')
         try:
             if win32com.client.GetObject(Class='Excel.Application'):
                 self.__message_and_exit('Excelを閉じて下さい。')
@@ -126,13 +259,75 @@ class WinMergeXlsx:
             except PermissionError:
                 message = str(self.output_html_files) + 'へのアクセス権がありません。'
                 self.__message_and_exit(message)
-        # エクセルレポートファイル
+        # 前回分けて出力したブック(前回の一覧シートだけのブックからリンクしているもの)
+        prev_books = read_linked_books(self.output)
+        # エクセルレポートファイル(差分更新時は前回分として残す)
         if (os.path.exists(self.output)):
             try:
-                os.remove(self.output)
+                if self.incremental:
+                    os.replace(self.output, self.output_prev)
+                else:
+                    os.remove(self.output)
             except PermissionError:
                 message = str(self.output) + 'へのアクセス権がありません。'
                 self.__message_and_exit(message)
+        prefix, suffix = self.output.stem + '_', self.output.suffix
+        for name in prev_books:
+            number = name[len(prefix):-len(suffix)] if name.startswith(prefix) and name.endswith(suffix) else ''  # noqa: E501
+            path = self.output.parent / name
+            if number.isdigit() and path.exists():
+                try:
+                    os.remove(path)
+                except PermissionError:
+                    self.__message_and_exit(str(path) + 'へのアクセス権がありません。')  # noqa: E501
+        # 前回分との対応表(差分更新でなければ今回のブックと合わなくなるため消す)
+        if self.incremental:
+            self.manifest = self._load_manifest()
+        elif os.path.exists(self.output_manifest):
+            try:
+                os.remove(self.output_manifest)
+            except PermissionError:
+                self.__message_and_exit(str(self.output_manifest) + 'へのアクセス権がありません。')  # noqa: E501
+
+    def _load_manifest(self):
+        """前回分との対応表を読み込む
+        """
+        if not (os.path.exists(self.output_manifest) and os.path.exists(self.output_prev)):  # noqa: E501
+            return {}
+        with open(self.output_manifest, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') != VERSION or manifest.get('formats') != DIFF_FORMATS:  # noqa: E501
+            return {}  # 書式が変わった場合は全て作り直す
+        if manifest.get('settings') != self._manifest_settings():
+            return {}  # シートの中身が変わる設定が変わった場合も全て作り直す
+        if manifest.get('book') != self._book_fingerprint(self.output_prev):
+            return {}  # 対応表を保存したときのブックではない
+        return manifest['sheets']
+
+    def _save_manifest(self):
+        """次回の差分更新のために対応表を保存する
+        """
+        sheets = {}
+        for name, source in self.sheet_sources.items():
+            sheets[source['path']] = {'sheet': name, 'digests': source['digests'], 'parts': source.get('parts', [])}  # noqa: E501
+        manifest = {
+            'version': VERSION, 'formats': DIFF_FORMATS,
+            'settings': self._manifest_settings(),
+            'book': self._book_fingerprint(self.output), 'sheets': sheets,
+        }
+        with open(self.output_manifest, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+
+    def _manifest_settings(self):
+        """対応表に記録する差分シートの中身が変わる設定
+        """
+        return {key: globals()[key] for key in MANIFEST_KEYS}
+
+    def _book_fingerprint(self, path):
+        """対応表がどのブックのものかを確かめるための(サイズ, 更新日時[ns])
+        """
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
 
     def __message_and_exit(self, message):
         """メッセージを表示して終了
@@ -140,11 +335,16 @@ class WinMergeXlsx:
         print('\nError : ' + message)
         sys.exit(-1)
 
+    @profiled
     def _generate_html_by_winmerge(self):
         """WinMergeにてhtmlレポート生成
         """
         print("\n[generate html by winmerge]")
 
+        if WINMERGE_SHARDS > 1:
+            self._generate_html_by_winmerge_shards()
+            return
+
         command = [
             WINMERGE_EXE,
             str(self.base),         # 比較元のフォルダ
@@ -155,69 +355,267 @@ class WinMergeXlsx:
         print(' '.join(command))
         subprocess.run(command)
 
+        self._load_summary_html()
+
+    def _generate_html_by_winmerge_shards(self):
+        """サブフォルダごとにWinMergeを並列に実行して1つのhtmlレポートにまとめる
+        """
+        winmerge = ShardedWinMerge(
+            WINMERGE_EXE, WINMERGE_OPTIONS, self.base, self.latest,
+            self.output_shards, WINMERGE_SHARDS, WINMERGE_SHARD_DEPTH,
+        )
+        winmerge.run()
+        self.pairs = winmerge.merge(self.output_html_files)
+        self.pair_reports = {pair.rel_path: pair for pair in self.pairs if pair.has_report}  # noqa: E501
+        report_names = {pair.rel_path: pair.report.stem for pair in self.pairs if pair.report is not None}  # noqa: E501
+        with open(self.output_html, 'w', encoding='utf-8') as f:
+            write_summary_html(f, self.base, self.latest, self.pairs, self.output_html_files.name, report_names)  # noqa: E501
+        print(f'- {len(self.pairs)} files in {len(winmerge.shards)} summary reports')  # noqa: E501
+
+    def _load_summary_html(self):
+        """一覧のhtmlレポートを読み込む
+        """
+        if not os.path.exists(self.output_html):
+            self.__message_and_exit(str(self.output_html) + 'が出力されませんでした。')  # noqa: E501
+        self.profiler.count_file_size('report_bytes', self.output_html)
+        self.pairs = list(parse_summary(self.output_html, self.base, self.latest))  # noqa: E501
+        self.pair_reports = {pair.rel_path: pair for pair in self.pairs if pair.has_report}  # noqa: E501
+        print(f'- {len(self.pairs)} files in summary report')
+
+    @profiled
+    def _generate_html_by_native(self):
+        """内蔵エンジンにてhtmlレポート生成
+        """
+        print("\n[generate html by native engine]")
+
+        cache = HashCache(self.output_cache, HASH_CACHE_MAX_BYTES, LINE_HASH) if HASH_CACHE else None  # noqa: E501
+        engine = NativeEngine(
+            self.base, self.latest, self.jobs, cache,
+            quick_compare_by_date=QUICK_COMPARE_BY_DATE,
+            hash_use_mmap=HASH_USE_MMAP,
+            diff_max_cost=DIFF_MAX_COST,
+            inline_diff=INLINE_DIFF,
+            detect_moves=DETECT_MOVES,
+        )
+        try:
+            engine.compare()
+        finally:
+            if cache:
+                cache.close()
+                print(f'- {cache.hits} hash cache hits')
+        self.engine = engine
+        self.pairs = engine.pairs
+        self.profiler.count('files', len(self.pairs))
+        self.profiler.count('input_bytes', sum(stat[0] for pair in self.pairs for stat in pair.stats if stat))  # noqa: E501
+        self.pair_reports = {pair.rel_path: pair for pair in self.pairs if pair.has_report}  # noqa: E501
+
+        skip = []
+        for rel_path, pair in self.pair_reports.items():
+            digests = [info.digest for info in pair.infos]
+            if self._find_prev_sheet(rel_path, digests):
+                skip.append(rel_path)
+        if BACKEND != 'xlsx':
+            engine.write_html(self.output_html, self.output_html_files, skip, CONTEXT_LINES)  # noqa: E501
+
+        identical = sum(1 for pair in self.pairs if pair.status == STATUS_IDENTICAL)  # noqa: E501
+        print(f'- {len(self.pairs)} files compared ({identical} identical)')
+        moves = sum(1 for pair in self.pairs for opcode in pair.opcodes if opcode[0] == OP_MOVED_TO)  # noqa: E501
+        if moves:
+            self.profiler.count('moved_blocks', moves)
+            print(f'- {moves} moved blocks')
+
     def _convert_html_to_xlsx(self):
         """htmlレポートをエクセルファイルに変換する
         """
         try:
             self._open_book()
+            if EXCEL_PERFORMANCE_MODE:
+                self._suspend_excel()
             self._format_summary_sheet()
             self._copy_html_files()
             self._format_diff_sheets()
             self._set_home_position(self.summary_ws)
             self._save_book()
+            if self.incremental:
+                self._save_manifest()
+                self._remove_prev_book()
 
         finally:
+            if self.prev_wb:
+                self.prev_wb.Close(SaveChanges=False)
+            self._restore_excel()
             self.excel.Quit()
 
+    @profiled
+    def _write_xlsx(self):
+        """エクセルを使わずにxlsxファイルを出力する
+        """
+        print("\n[write xlsx]")
+
+        sheet_names = plan_sheet_names(
+            self.pairs, reserved=(SUMMARY_SHEET_NAME,))
+        if self.incremental:
+            for rel_path, name in sheet_names.items():
+                self._record_sheet_source(self.pair_reports[rel_path], name)
+
+        books = []
+        if OUTPUT_SPLIT_BY_FOLDER or OUTPUT_MAX_SHEETS or OUTPUT_MAX_BYTES:
+            books = plan_books(
+                self.pairs, sheet_names, OUTPUT_SPLIT_BY_FOLDER,
+                OUTPUT_MAX_SHEETS, OUTPUT_MAX_BYTES,
+                DIFF_MAX_ROWS, CONTEXT_LINES,
+            )
+        if len(books) > 1:
+            writers = self._write_xlsx_books(sheet_names, books)
+        else:
+            writer = self._create_writer(self.output)
+            writer.write(
+                self.base, self.latest, self.pairs, sheet_names,
+                self._report_rows(sheet_names, self.pairs),
+                self.output_prev, self.carried,
+            )
+            writers = [writer]
+        if self.incremental:
+            for writer in writers:
+                for name, parts in writer.parts.items():
+                    self.sheet_sources[name]['parts'] = parts
+            self._save_manifest()
+            self._remove_prev_book()
+        print('\nxlsxへの変換が完了しました。')
+
+    def _write_xlsx_books(self, sheet_names, books):
+        """差分シートを複数のブックに分けて出力し、一覧シートだけのブックから各ブックへリンクする
+        """
+        order = [pair for book in books for pair in book]
+        report_rows = self._report_rows(sheet_names, order)
+        book_names = {}
+        writers = []
+        for i, pairs in enumerate(books, 1):
+            path = self._book_path(i)
+            print(f'[{path.name}]')
+            writer = self._create_writer(path)
+            writer.write_diff_sheets(pairs, sheet_names, report_rows, self.output_prev, self.carried)  # noqa: E501
+            writers.append(writer)
+            book_names.update((pair.rel_path, path.name) for pair in pairs)
+
+        print(f'[{self.output.name}]')
+        index = self._create_writer(self.output)
+        index.write_index(self.base, self.latest, self.pairs, sheet_names, book_names)  # noqa: E501
+        return writers
+
+    def _create_writer(self, path):
+        """xlsxファイルを直接出力するライターを作成する
+        """
+        # 差分更新ではシートを単独で引き継げるよう共有文字列を使わない
+        shared_strings_max = 0 if self.incremental else XLSX_SHARED_STRINGS
+        return XlsxReportWriter(
+            path, DIFF_FORMATS, DIFF_ZOOM_RATIO,
+            SUMMARY_START_ROW, DIFF_START_ROW, HOME_POSITION,
+            shared_strings_max, self.profiler, DIFF_MAX_ROWS,
+        )
+
+    def _book_path(self, number):
+        """差分シートを分けて出力するブックのパス
+        """
+        return self.output.with_name(f'{self.output.stem}_{number}{self.output.suffix}')  # noqa: E501
+
+    def _report_rows(self, sheet_names, pairs):
+        """差分シートの行を返す関数を取得する
+
+        並列数が2以上の場合はファイル比較レポートをプロセスプールで先に読み込み、
+        出力する順番(pairsの順)通りに渡す
+        """
+        reports = [
+            pair for pair in pairs
+            if pair.report is not None and pair.rel_path in sheet_names
+            and sheet_names[pair.rel_path] not in self.carried
+        ]
+        if self.jobs <= 1 or len(reports) <= 1:
+            return self._iter_rows
+
+        paths = [pair.report for pair in reports]
+        for path in paths:
+            self.profiler.count_file_size('report_bytes', path)
+        prefetch = self.jobs * REPORT_PREFETCH
+        parse = partial(parse_report, context_lines=CONTEXT_LINES)
+        parsed = zip(reports, map_jobs(parse, paths, self.jobs, prefetch))
+        expected = {id(pair) for pair in reports}
+
+        def report_rows(pair):
+            if id(pair) not in expected:
+                return self._iter_rows(pair)
+            for report_pair, rows in parsed:
+                if report_pair is pair:
+                    return iter(rows)
+            return self._iter_rows(pair)
+
+        return report_rows
+
+    def _iter_rows(self, pair):
+        """差分シートの行を順に取得する(読み込むレポートのサイズを数える)
+        """
+        self.profiler.count_file_size('report_bytes', pair.report)
+        return iter_rows(pair)
+
+    @profiled
     def _open_book(self):
         """ブックを開く
         """
-        self.excel = win32com.client.Dispatch('Excel.Application')
+        self.excel = ComProxy(EXCEL_APPLICATIONS[EXCEL_APPLICATION](), self.profiler)  # noqa: E501
         self.wb = self.excel.Workbooks.Open(self.output_html)
         self.summary_ws = self.wb.Worksheets(SUMMARY_WS_NUM)
 
+    def _suspend_excel(self):
+        """画面更新, イベント, 警告, 自動計算を止める
+        """
+        states = {
+            'ScreenUpdating': False,
+            'EnableEvents': False,
+            'DisplayAlerts': False,
+            'Calculation': xlCalculationManual,
+        }
+        for name, value in states.items():
+            self.excel_states[name] = getattr(self.excel, name)
+            setattr(self.excel, name, value)
+
+    def _restore_excel(self):
+        """止めていた画面更新などを元に戻す
+        """
+        for name, value in self.excel_states.items():
+            setattr(self.excel, name, value)
+        self.excel_states = {}
+
+    @profiled
     def _format_summary_sheet(self):
         """一覧シートの書式調整
+
+        シート名は読み込んだ一覧(self.pairs)から1回で決め、リンクのある行だけを書き換える
         """
         print("\n[format summary sheet]")
 
         ws = self.summary_ws
-        end_row = ws.Cells(ws.Rows.Count, 1).End(xlUp).Row
-
-        # 同名シート有無の確認
-        print('- check same filename ...', end='', flush=True)
-        for row in range(SUMMARY_START_ROW, end_row+1):
-            name_cell = ws.Range(SUMMARY_NAME_COL + str(row))
-            if not name_cell.Value:
-                break
-            if name_cell.Hyperlinks.Count > 0:
-                sheet_name = name_cell.Value.lower()
-                if sheet_name in self.sheet_memo:
-                    self.sheet_memo[sheet_name] += 1
-                else:
-                    self.sheet_memo[sheet_name] = 1
-        print(' done')
-
-        # htmlファイルとハイパーリンクの設定
-        for row in range(SUMMARY_START_ROW, end_row+1):
-            name_cell = ws.Range(SUMMARY_NAME_COL + str(row))
-            if not name_cell.Value:
-                break
-
-            if name_cell.Hyperlinks.Count > 0:
-                sname_src = sname_dst = name_cell.Value
-                sname_src_lower = sname_src.lower()
-                if sname_src_lower in self.sheet_count:
-                    self.sheet_count[sname_src_lower] += 1
-                else:
-                    self.sheet_count[sname_src_lower] = 1
+        if not self.pairs:
+            return
+        sheet_names = plan_sheet_names(self.pairs, reserved=(ws.Name,))
 
-                if self.sheet_memo[sname_src_lower] >= 2:
-                    sname_dst += f'_{self.sheet_count[sname_src_lower]}'
+        # ファイル名の列をまとめて読み込み、一覧と行がずれていないか確かめる
+        end_row = SUMMARY_START_ROW + len(self.pairs) - 1
+        values = ws.Range(f'{SUMMARY_NAME_COL}{SUMMARY_START_ROW}:{SUMMARY_NAME_COL}{end_row}').Value  # noqa: E501
+        if not isinstance(values, tuple):
+            values = ((values,),)  # 1行だけの場合
 
-                self._change_hyperlink(name_cell, sname_dst)
-                folder_cell = ws.Range(SUMMARY_FOLDER_COL + str(row)).Value
-                self._rename_html_files(sname_src, sname_dst, folder_cell)
+        # htmlファイルとハイパーリンクの設定
+        for row, pair, (value,) in zip(itertools.count(SUMMARY_START_ROW), self.pairs, values):  # noqa: E501
+            name = sheet_names.get(pair.rel_path)
+            if name is None:
+                continue
+            if isinstance(value, str) and value != pair.name:
+                print(f'- {pair.name} not found in row {row} (skipped)')
+                continue
+            self._change_hyperlink(ws.Range(SUMMARY_NAME_COL + str(row)), name)  # noqa: E501
+            self.sheet_pairs[name] = pair
+            if self.incremental:
+                self._record_sheet_source(pair, name)
 
     def _change_hyperlink(self, name_cell, name_dst):
         """ハイパーリンクの修正
@@ -227,51 +625,178 @@ class WinMergeXlsx:
             hl.SubAddress = name_dst + '!' + HOME_POSITION
             hl.TextToDisplay = name_dst
 
-    def _rename_html_files(self, name_src, name_dst, folder):
-        """htmlレポートのリネーム
+    def _record_sheet_source(self, pair, name):
+        """シートの元になったファイルの組を記録し、前回から引き継げるか調べる
+        """
+        digests = self._pair_digests(pair)
+        self.sheet_sources[name] = {'path': pair.rel_path, 'digests': digests}  # noqa: E501
+        prev_sheet = self._find_prev_sheet(pair.rel_path, digests)
+        if prev_sheet:
+            self.carried[name] = prev_sheet
+
+    def _pair_digests(self, pair):
+        """ファイルの組の左右のハッシュ値(未取得なら求める)
+        """
+        return [
+            info.digest or (file_digest(path) if path and os.path.exists(path) else None)  # noqa: E501
+            for path, info in zip((pair.left, pair.right), pair.infos)
+        ]
+
+    def _find_prev_sheet(self, rel_path, digests):
+        """入力が前回と同じであれば前回のシート名を返す
         """
-        sheet_name = folder.replace('\\', '_') + '_' + name_src if folder else name_src  # noqa: E501
-        src = f'{self.output_html_files}/{sheet_name}.html'
-        dst = f'{self.output_html_files}/{name_dst}.html'
-        if sheet_name != name_dst:
-            os.rename(src, dst)
-            print('- ' + sheet_name + ' ---> ' + name_dst)
+        prev = self.manifest.get(rel_path)
+        if prev and prev['digests'] == digests and not prev.get('parts'):  # 続きのシートに分けたものは作り直す  # noqa: E501
+            return prev['sheet']
+        return None
 
+    @profiled
     def _copy_html_files(self):
         """htmlレポートをエクセルにコピー
         """
         print("\n[copy html files]")
 
+        sources = self._sheet_reports()
+        if self.carried:
+            self.prev_wb = self.excel.Workbooks.Open(str(self.output_prev))
+            sources.update(dict.fromkeys(self.carried))
+
         count = 1
-        for html in self.output_html_files.glob('**/*.html'):
+        for name in sorted(sources, key=str.lower):
+            html = sources[name]
+            if html is None:
+                if self._copy_prev_sheet(name, count):
+                    count += 1
+                    continue
+                html = self._sheet_report(name, regenerate=True)
+                if html is None:
+                    continue
             try:
-                print(f'- {html.name} ...', end='', flush=True)
-                diff_wb = self.excel.Workbooks.Open(html)
-                diff_ws = diff_wb.Worksheets(1)
-                diff_ws.Copy(Before=None, After=self.wb.Worksheets(count))
-                diff_wb.Close()
+                print(f'- {name} ...', end='', flush=True)
+                with self.profiler.phase('copy_sheet', sheet=name):
+                    self.profiler.count_file_size('report_bytes', html)
+                    diff_wb = self.excel.Workbooks.Open(html)
+                    diff_ws = diff_wb.Worksheets(1)
+                    diff_ws.Copy(Before=None, After=self.wb.Worksheets(count))  # noqa: E501
+                    diff_wb.Close()
+                    self.wb.Worksheets(count+1).Name = name
                 count += 1
                 print(' done')
-            except win32com.client.pywintypes.com_error as e:
+            except com_error as e:
                 print(' skipped *** unknown error ***')
                 print(f'\n{e}\n')
 
+    def _sheet_reports(self):
+        """シート名 -> コピーするhtmlレポートのパス
+
+        htmlレポートはリネームせず、コピーしたシートの名前を後から設定する
+        """
+        reports = {}
+        for name in self.sheet_pairs:
+            if name not in self.carried:
+                html = self._sheet_report(name)
+                if html is not None:
+                    reports[name] = html
+        return reports
+
+    def _sheet_report(self, name, regenerate=False):
+        """シートにコピーするhtmlレポートのパス(無ければNone)
+
+        regenerateの場合、内蔵エンジンで出力を省いたレポートはここで出力する
+        """
+        pair = self.sheet_pairs[name]
+        if pair.report is not None:
+            html = pair.report
+        else:
+            if self.report_names is None:
+                self.report_names = plan_report_names(self.pairs)  # write_html()と同じ名前  # noqa: E501
+            html = self.output_html_files / (self.report_names[pair.rel_path] + '.html')  # noqa: E501
+            if regenerate and self.engine is not None and not html.exists():
+                self.engine.write_diff_html(html, pair, CONTEXT_LINES)
+        return html if html.exists() else None
+
+    def _copy_prev_sheet(self, name, count):
+        """前回のエクセルからシートを引き継ぐ
+        """
+        try:
+            print(f'- {name} ...', end='', flush=True)
+            prev_ws = self.prev_wb.Worksheets(self.carried[name])
+            prev_ws.Copy(Before=None, After=self.wb.Worksheets(count))
+            self.wb.Worksheets(count+1).Name = name
+            print(' carried over')
+            return True
+        except com_error as e:
+            del self.carried[name]
+            print(' not found in previous report (regenerating)')
+            print(f'\n{e}\n')
+            return False
+
+    @profiled
     def _format_diff_sheets(self):
         """差分シートの書式調整
         """
         print("\n[format diff sheets]")
 
+        self._parse_report_groups()
+        names = []
         for i in range(DIFF_START_ROW, self.wb.Worksheets.Count+1):
             ws = self.wb.Worksheets(i)
-            print(f'- {ws.Name} ...', end='', flush=True)
-            self._set_zoom(ws)
-            self._freeze_panes(ws)
-            self._remove_hyperlink_from_no(ws)
-            self._set_format(ws)
-            self._set_autofilter(ws)
-            self._set_home_position(ws)
+            if ws.Name in self.carried:
+                continue
+            name = ws.Name
+            print(f'- {name} ...', end='', flush=True)
+            with self.profiler.phase('format_sheet', sheet=name):
+                if EXCEL_PERFORMANCE_MODE:
+                    self._set_view(ws)
+                else:
+                    self._set_zoom(ws)
+                    self._freeze_panes(ws)
+                self._remove_hyperlink_from_no(ws)
+                self._set_format(ws)
+                self._set_autofilter(ws)
+                if not EXCEL_PERFORMANCE_MODE:
+                    self._set_home_position(ws)
+            names.append(name)
             print(' done')
 
+        if EXCEL_PERFORMANCE_MODE and names:
+            self._set_zoom_all(names)
+
+    def _parse_report_groups(self):
+        """ファイル比較レポートから差分がある行のまとまりをプロセスプールで並列に求める
+        """
+        sheets = [
+            (name, pair) for name, pair in self.sheet_pairs.items()
+            if pair.report is not None and name not in self.carried
+        ]
+        if self.jobs <= 1 or len(sheets) <= 1:
+            return
+        paths = [pair.report for _, pair in sheets]
+        for path in paths:
+            self.profiler.count_file_size('report_bytes', path)
+        results = map_jobs(parse_report_groups, paths, self.jobs)
+        for (name, _), result in zip(sheets, results):
+            self.report_groups[name] = result
+
+    def _set_view(self, ws):
+        """ウィンドウ枠の固定とホームポジションを1回のアクティブ化で設定する
+        """
+        ws.Activate()
+        window = self.excel.ActiveWindow
+        window.SplitColumn = 0
+        window.SplitRow = DIFF_START_ROW - 1
+        window.FreezePanes = True
+        window.ScrollRow = 1
+        window.ScrollColumn = 1
+        ws.Range(HOME_POSITION).Select()
+
+    def _set_zoom_all(self, names):
+        """シートをグループ化して拡大率をまとめて設定する
+        """
+        self.wb.Worksheets(tuple(names)).Select()
+        self.excel.ActiveWindow.Zoom = DIFF_ZOOM_RATIO
+        self.summary_ws.Select()  # グループ化を解除
+
     def _set_zoom(self, ws):
         """拡大率を設定する
         """
@@ -314,6 +839,7 @@ class WinMergeXlsx:
         """表を追加する
         """
         end_row = self._get_diff_end_row(ws)
+        self.profiler.count('rows', end_row - DIFF_START_ROW + 1)
 
         # 表の見出し
         ws_range = ws.Range(f['col'] + '1')
@@ -327,6 +853,35 @@ class WinMergeXlsx:
         ws_range.Borders.Color = int('000000', 16)
         ws_range.Borders.LineStyle = xlContinuous
 
+        # 表の中身(差分のデータがあればまとめて設定する)
+        pair = self.sheet_pairs.get(ws.Name)
+        if ws.Name in self.report_groups:
+            groups, row_count = self.report_groups[ws.Name]
+            moved = []
+        else:
+            groups, row_count, moved = self._changed_groups(pair) if pair else (None, None, None)  # noqa: E501
+        if pair and row_count + DIFF_START_ROW == end_row:
+            self._fill_extra_table_bulk(ws, f, end_row, groups, moved)
+        else:
+            self._fill_extra_table(ws, f, end_row)
+
+    def _changed_groups(self, pair):
+        """差分がある行のまとまり、差分シートの行数、移動元の行のまとまりを取得する
+        """
+        if pair.report is None:  # 一致行の省略も編集操作から求める
+            return (
+                pair.changed_groups(CONTEXT_LINES),
+                pair.row_count(CONTEXT_LINES),
+                pair.moved_groups(CONTEXT_LINES),
+            )
+        # WinMergeのレポートは省略されずにそのままコピーされる
+        self.profiler.count_file_size('report_bytes', pair.report)
+        ops = [row.op for row in iter_report_rows(pair)]
+        return changed_groups(ops), len(ops), moved_groups(ops)
+
+    def _fill_extra_table(self, ws, f, end_row):
+        """表の中身をセルの背景色を見ながら設定する
+        """
         # 表の中身を一旦"-"で埋める
         ws_range = ws.Range(f['col'] + '2:' + f['col'] + str(end_row))
         ws_range.Value = '-'
@@ -352,6 +907,43 @@ class WinMergeXlsx:
             ws_range.Value = ''
             ws_range.Interior.Color = int('FFFFFF', 16)
 
+    def _fill_extra_table_bulk(self, ws, f, end_row, groups, moved=()):
+        """表の中身を差分のデータからまとめて設定する
+
+        値は2次元配列で一度に書き込み、差分がある箇所の背景色は
+        複数範囲をまとめたアドレスで設定する
+        移動元の行のまとまり(moved)は差分がない行と同じ背景色でMOVED_TEXTを表示する
+        """
+        col = f['col']
+        values = [['-'] for _ in range(DIFF_START_ROW, end_row+1)]
+        for start, count in moved:
+            for i in range(start, start+count):
+                values[i][0] = MOVED_TEXT
+        addresses = []
+        for start, count in groups:
+            for i in range(start, start+count):
+                values[i][0] = ''
+            first = DIFF_START_ROW + start
+            addresses.append(f'{col}{first}:{col}{first+count-1}')
+
+        ws_range = ws.Range(col + str(DIFF_START_ROW) + ':' + col + str(end_row))  # noqa: E501
+        ws_range.Value = values
+        ws_range.Interior.Color = int('E0E0E0', 16)
+        for address in self._join_addresses(addresses):
+            ws.Range(address).Interior.Color = int('FFFFFF', 16)
+
+    def _join_addresses(self, addresses):
+        """複数のアドレスをRangeで扱える長さまでカンマでつなげる
+        """
+        joined = ''
+        for address in addresses:
+            if joined and len(joined) + 1 + len(address) > MAX_ADDRESS_LENGTH:
+                yield joined
+                joined = ''
+            joined = joined + ',' + address if joined else address
+        if joined:
+            yield joined
+
     def _set_autofilter(self, ws):
         """オートフィルタを設定する
         """
@@ -367,12 +959,22 @@ class WinMergeXlsx:
         ws.Activate()
         ws.Range(HOME_POSITION).Select()
 
+    @profiled
     def _save_book(self):
         """ブックを保存する
         """
         self.wb.SaveAs(str(self.output), FileFormat=xlOpenXMLWorkbook)
         print('\nxlsxへの変換が完了しました。')
 
+    def _remove_prev_book(self):
+        """保存が完了したら前回分のエクセルを削除する
+        """
+        if self.prev_wb:
+            self.prev_wb.Close(SaveChanges=False)
+            self.prev_wb = None
+        if os.path.exists(self.output_prev):
+            os.remove(self.output_prev)
+
     def _get_diff_end_row(self, ws):
         """差分シートの最終行の番号を取得する
         """
@@ -382,16 +984,33 @@ class WinMergeXlsx:
 
 
 if __name__ == '__main__':
-    if len(sys.argv) < 3:
-        print(f'Usage : {sys.argv[0]} <base> <latest> [<output>]')
-        sys.exit(1)
-
+    import argparse
     import time
 
+    parser = argparse.ArgumentParser()
+    parser.add_argument('base', help='比較元のフォルダ')
+    parser.add_argument('latest', help='比較先のフォルダ')
+    parser.add_argument('output', nargs='?', default='./output.xlsx', help='出力するエクセルファイル')  # noqa: E501
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='並列数(0 : CPU数)')  # noqa: E501
+    parser.add_argument('--incremental', action='store_true', help='前回から入力が変わっていないシートを引き継ぐ')  # noqa: E501
+    parser.add_argument('--profile', metavar='JSON', help='処理ごとの時間と回数をJSONで出力する')  # noqa: E501
+    parser.add_argument('--chrome-trace', metavar='JSON', help='処理ごとの時間をChromeのトレースイベント形式で出力する')  # noqa: E501
+    args = parser.parse_args()
+
     print(f'{sys.argv[0]} {VERSION}')
 
     start = time.perf_counter()
-    WinMergeXlsx(*sys.argv[1:4]).generate()
+    winmerge_xlsx = WinMergeXlsx(
+        args.base, args.latest, args.output,
+        jobs=args.jobs, incremental=args.incremental,
+    )
+    try:
+        winmerge_xlsx.generate()
+    finally:
+        if args.profile:
+            winmerge_xlsx.profiler.write_json(args.profile)
+        if args.chrome_trace:
+            winmerge_xlsx.profiler.write_chrome_trace(args.chrome_trace)
     end = time.perf_counter()
 
     print(f'elp = {end-start:.3f}s')
@@ -0,0 +1,896 @@
+"""エクセルを使わずにxlsxファイルを出力する
+"""
+import os
+import re
+import shutil
+import zipfile
+import xml.etree.ElementTree as ET
+from functools import lru_cache
+from datetime import datetime, timezone
+from xml.sax.saxutils import escape
+
+from profiler import Profiler
+from diff_model import (
+    STATUS_TEXTS, DIFF_COLORS, INLINE_COLOR, DATE_FORMAT, CHANGED_OPS,
+    REVIEW_OPS, OP_MOVED_FROM, MOVED_TEXT, MAX_SHEET_NAME, format_date,
+    expand_tabs,
+)
+
+APPLICATION = 'winmerge_xlsx'  # docProps/app.xmlに記録するアプリケーション名
+DEFAULT_FONT = 'ＭＳ Ｐゴシック'  # 既定のフォント
+DEFAULT_FONT_SIZE = 11         # 既定のフォントサイズ
+
+NO_COLOR = 'F0F0F0'            # 行番号列の背景色
+NO_FONT_SIZE = 12              # 行番号列のフォントサイズ
+HEADER_COLOR = 'CCFFCC'        # 追加列の見出しの背景色
+UNCHANGED_COLOR = 'E0E0E0'     # 追加列の差分がない行の背景色
+BORDER_COLOR = '000000'        # 罫線の色
+
+WRITE_BUFFER_SIZE = 64 * 1024  # ワークシートの書き込みバッファのサイズ
+SHARED_STRING_CELL = b' t="s"'  # 共有文字列を参照するセルの属性
+SUMMARY_SHEET_NAME = 'Summary'  # 一覧シートの名前
+NAV_PREV_TEXT = '<<'           # 続きのシートから前のシートへのリンクの表示
+NAV_NEXT_TEXT = '続き : {}'    # 続きのシートへのリンクの表示
+SHARED_STRING_MAX_LENGTH = 64  # 共有文字列にする文字列の最大長
+
+SUMMARY_HEADER = ('Filename', 'Folder', 'Comparison result', 'Left Date', 'Right Date', 'Extension')  # noqa: E501
+SUMMARY_WIDTHS = (30, 30, 28, 20, 20, 10)  # 一覧シートの列幅
+BOOK_HEADER = 'Workbook'                   # 分けて出力した場合のブックの列の見出し
+BOOK_WIDTH = 24                            # 分けて出力した場合のブックの列の幅
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+NS_MAIN = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+NS_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+NS_PKG_REL = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+_ILLEGAL_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]|_(?=x[0-9A-Fa-f]{4}_)')  # noqa: E501
+
+
+@lru_cache(maxsize=None)
+def col_index(col):
+    """列名を列番号(1始まり)に変換する
+    """
+    index = 0
+    for c in col.upper():
+        index = index * 26 + ord(c) - ord('A') + 1
+    return index
+
+
+def col_name(index):
+    """列番号(1始まり)を列名に変換する
+    """
+    name = ''
+    while index:
+        index, rem = divmod(index - 1, 26)
+        name = chr(ord('A') + rem) + name
+    return name
+
+
+def xml_text(text):
+    """セルの文字列をxml用にエスケープする
+
+    xmlで使えない制御文字は_xHHHH_の形式にする
+    """
+    text = _ILLEGAL_XML_CHARS.sub(lambda m: f'_x{ord(m.group()):04X}_', text)
+    return escape(text)
+
+
+def xml_attr(text):
+    """属性値をxml用にエスケープする
+    """
+    return escape(text, {'"': '&quot;'})
+
+
+def run_props(font, size, color):
+    """書式付きの文字列の一部の範囲の書式(rPr)
+    """
+    return f'<rPr><rFont val="{xml_attr(font)}"/><charset val="128"/><family val="3"/><sz val="{size}"/><color rgb="FF{color}"/></rPr>'  # noqa: E501
+
+
+class RichText:
+    """一部の文字の書式を変えた文字列(書式付きのinlineStrとしてセルに書き込む)
+    """
+    __slots__ = (
+        'text',       # 文字列
+        'spans',      # 書式を変える文字の範囲(開始, 終了)のリスト
+        'run_props',  # 書式を変える範囲の書式(rPr)
+    )
+
+    def __init__(self, text, spans, run_props):
+        self.text = text
+        self.spans = spans
+        self.run_props = run_props
+
+    def to_xml(self):
+        """<is>の中身
+        """
+        xml = []
+        pos = 0
+        for start, end in self.spans:
+            if pos < start:
+                xml.append(f'<r><t xml:space="preserve">{xml_text(self.text[pos:start])}</t></r>')  # noqa: E501
+            xml.append(f'<r>{self.run_props}<t xml:space="preserve">{xml_text(self.text[start:end])}</t></r>')  # noqa: E501
+            pos = end
+        if pos < len(self.text):
+            xml.append(f'<r><t xml:space="preserve">{xml_text(self.text[pos:])}</t></r>')  # noqa: E501
+        return ''.join(xml)
+
+
+def read_sheet_parts(path):
+    """このモジュールで出力したxlsxファイルのシート名からワークシートのパスへの対応を取得する
+
+    エクセルで保存し直したファイルなど、他で出力したものは空を返す
+    """
+    if not os.path.exists(path):
+        return {}
+    with zipfile.ZipFile(path) as zf:
+        app = ET.fromstring(zf.read('docProps/app.xml'))
+        if app.findtext('{*}Application') != APPLICATION:
+            return {}
+        rels = ET.fromstring(zf.read('xl/_rels/workbook.xml.rels'))
+        targets = {rel.get('Id'): 'xl/' + rel.get('Target') for rel in rels}
+        workbook = ET.fromstring(zf.read('xl/workbook.xml'))
+        return {
+            sheet.get('name'): targets[sheet.get(f'{{{NS_REL}}}id')]
+            for sheet in workbook.iter(f'{{{NS_MAIN}}}sheet')
+        }
+
+
+def read_linked_books(path):
+    """このモジュールで出力したxlsxファイルからハイパーリンクしている外部のブックのパスを取得する
+
+    エクセルで保存し直したファイルなど、他で出力したものは空を返す
+    """
+    if not os.path.exists(path):
+        return []
+    targets = []
+    with zipfile.ZipFile(path) as zf:
+        app = ET.fromstring(zf.read('docProps/app.xml'))
+        if app.findtext('{*}Application') != APPLICATION:
+            return []
+        for name in zf.namelist():
+            if name.startswith('xl/worksheets/_rels/'):
+                rels = ET.fromstring(zf.read(name))
+                targets += [rel.get('Target') for rel in rels if rel.get('TargetMode') == 'External']  # noqa: E501
+    return list(dict.fromkeys(targets))
+
+
+def uses_shared_strings(zf, part):
+    """ワークシートが共有文字列を参照するセル(t="s")を含むかどうか
+    """
+    tail = b''
+    with zf.open(part) as f:
+        while True:
+            chunk = f.read(WRITE_BUFFER_SIZE)
+            if not chunk:
+                return False
+            if SHARED_STRING_CELL in tail + chunk:
+                return True
+            tail = chunk[-len(SHARED_STRING_CELL):]
+
+
+def quote_sheet_name(name):
+    """数式やハイパーリンクで使うシート名
+    """
+    return "'" + name.replace("'", "''") + "'"
+
+
+class StyleSheet:
+    """セルの書式(styles.xml)を管理する
+    """
+    def __init__(self):
+        self.fonts = [(DEFAULT_FONT, DEFAULT_FONT_SIZE, False, None)]
+        self.fills = [None, 'gray125']
+        self.borders = [None]
+        self.xfs = [(0, 0, 0, None)]
+
+    def get(self, font=None, size=None, bold=False, color=None, fill=None, border=None, align=None):  # noqa: E501
+        """書式の番号を取得する(無ければ追加する)
+        """
+        font_key = (font or DEFAULT_FONT, size or DEFAULT_FONT_SIZE, bold, color)  # noqa: E501
+        xf = (
+            self._index(self.fonts, font_key),
+            self._index(self.fills, fill),
+            self._index(self.borders, border),
+            align,
+        )
+        return self._index(self.xfs, xf)
+
+    def _index(self, items, item):
+        """リスト中の番号を取得する(無ければ追加する)
+        """
+        if item not in items:
+            items.append(item)
+        return items.index(item)
+
+    def to_xml(self):
+        """styles.xmlの中身
+        """
+        xml = [XML_HEADER, f'<styleSheet xmlns="{NS_MAIN}">']
+
+        xml.append(f'<fonts count="{len(self.fonts)}">')
+        for name, size, bold, color in self.fonts:
+            xml.append('<font>')
+            if bold:
+                xml.append('<b/>')
+            xml.append(f'<sz val="{size}"/>')
+            if color:
+                xml.append(f'<color rgb="FF{color}"/>')
+            xml.append(f'<name val="{escape(name)}"/><family val="3"/><charset val="128"/></font>')  # noqa: E501
+        xml.append('</fonts>')
+
+        xml.append(f'<fills count="{len(self.fills)}">')
+        xml.append('<fill><patternFill patternType="none"/></fill>')
+        xml.append('<fill><patternFill patternType="gray125"/></fill>')
+        for color in self.fills[2:]:
+            xml.append(f'<fill><patternFill patternType="solid"><fgColor rgb="FF{color}"/><bgColor indexed="64"/></patternFill></fill>')  # noqa: E501
+        xml.append('</fills>')
+
+        xml.append(f'<borders count="{len(self.borders)}">')
+        xml.append('<border><left/><right/><top/><bottom/><diagonal/></border>')  # noqa: E501
+        for color in self.borders[1:]:
+            side = f'style="thin"><color rgb="FF{color}"/>'
+            xml.append(f'<border><left {side}</left><right {side}</right><top {side}</top><bottom {side}</bottom><diagonal/></border>')  # noqa: E501
+        xml.append('</borders>')
+
+        xml.append('<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>')  # noqa: E501
+        xml.append(f'<cellXfs count="{len(self.xfs)}">')
+        for font_id, fill_id, border_id, align in self.xfs:
+            attrs = f'numFmtId="0" fontId="{font_id}" fillId="{fill_id}" borderId="{border_id}" xfId="0"'  # noqa: E501
+            attrs += ' applyFont="1"' if font_id else ''
+            attrs += ' applyFill="1"' if fill_id else ''
+            attrs += ' applyBorder="1"' if border_id else ''
+            if align:
+                xml.append(f'<xf {attrs} applyAlignment="1"><alignment horizontal="{align}" vertical="center"/></xf>')  # noqa: E501
+            else:
+                xml.append(f'<xf {attrs}/>')
+        xml.append('</cellXfs>')
+
+        xml.append('<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>')  # noqa: E501
+        xml.append('</styleSheet>')
+        return ''.join(xml)
+
+
+class SharedStrings:
+    """共有文字列(sharedStrings.xml)を管理する
+
+    メモリ使用量を抑えるため、max_length文字以下の文字列をmax_count個まで登録し、
+    それ以外はセルに直接書き込む(inlineStr)
+    """
+    def __init__(self, max_count, max_length):
+        self.max_count = max_count
+        self.max_length = max_length
+        self.table = {}
+        self.count = 0
+
+    def index(self, text):
+        """文字列の番号を取得する(共有しない場合はNone)
+        """
+        if len(text) > self.max_length:
+            return None
+        index = self.table.get(text)
+        if index is None and len(self.table) < self.max_count:
+            index = self.table[text] = len(self.table)
+        if index is not None:
+            self.count += 1
+        return index
+
+    def to_xml(self):
+        """sharedStrings.xmlの中身
+        """
+        xml = [XML_HEADER, f'<sst xmlns="{NS_MAIN}" count="{self.count}" uniqueCount="{len(self.table)}">']  # noqa: E501
+        for text in self.table:
+            xml.append(f'<si><t xml:space="preserve">{xml_text(text)}</t></si>')  # noqa: E501
+        xml.append('</sst>')
+        return ''.join(xml)
+
+
+class XlsxSheet:
+    """ワークシート
+
+    行はwrite_rowで書き込んだ順にxlsxファイルへ直接出力するため、
+    列幅やズームなどの設定は最初の行を書き込む前に行う
+    """
+    def __init__(self, book, name, index):
+        self.book = book
+        self.name = name
+        self.part = f'xl/worksheets/sheet{index}.xml'
+        self.widths = {}
+        self.zoom = None
+        self.freeze_row = None
+        self.home = 'A1'
+        self.autofilter = None
+        self.hyperlinks = []
+        self.stream = None
+        self.buffer = []
+        self.buffer_size = 0
+
+    def set_width(self, col, width):
+        """列幅を設定する
+        """
+        self.widths[col_index(col)] = width
+
+    def add_hyperlink(self, ref, sheet_name, cell='A1', target=None):
+        """シートへのハイパーリンクを追加する
+
+        targetを指定した場合は外部のブック(相対パス)のシートへのリンクとする
+        """
+        self.hyperlinks.append((ref, quote_sheet_name(sheet_name) + '!' + cell, sheet_name, target))  # noqa: E501
+
+    def write_row(self, row, cells):
+        """1行分のセルを書き込む
+
+        cellsは(列名, 値, 書式番号)のリスト(値がRichTextの場合は共有しない)
+        """
+        if self.stream is None:
+            self._open()
+
+        shared = self.book.shared_strings
+        xml = [f'<row r="{row}">']
+        for col, value, style in sorted(cells, key=lambda c: col_index(c[0])):
+            ref = f'{col}{row}'
+            s = f' s="{style}"' if style else ''
+            if value is None or value == '':
+                xml.append(f'<c r="{ref}"{s}/>')
+            elif isinstance(value, (int, float)):
+                xml.append(f'<c r="{ref}"{s}><v>{value}</v></c>')
+            elif isinstance(value, RichText):
+                xml.append(f'<c r="{ref}"{s} t="inlineStr"><is>{value.to_xml()}</is></c>')  # noqa: E501
+            else:
+                index = shared.index(value) if shared else None
+                if index is None:
+                    xml.append(f'<c r="{ref}"{s} t="inlineStr"><is><t xml:space="preserve">{xml_text(value)}</t></is></c>')  # noqa: E501
+                else:
+                    xml.append(f'<c r="{ref}"{s} t="s"><v>{index}</v></c>')
+        xml.append('</row>')
+        self._write(''.join(xml))
+
+    def close(self):
+        """ワークシートの残りの部分を書き込んで閉じる
+        """
+        if self.stream is None:
+            self._open()
+        xml = ['</sheetData>']
+        if self.autofilter:
+            xml.append(f'<autoFilter ref="{self.autofilter}"/>')
+        targets = []
+        if self.hyperlinks:
+            xml.append('<hyperlinks>')
+            for ref, location, display, target in self.hyperlinks:
+                rid = ''
+                if target:
+                    targets.append(target)
+                    rid = f' r:id="rId{len(targets)}"'
+                xml.append(f'<hyperlink ref="{ref}"{rid} location="{xml_attr(location)}" display="{xml_attr(display)}"/>')  # noqa: E501
+            xml.append('</hyperlinks>')
+        xml.append('<pageMargins left="0.7" right="0.7" top="0.75" bottom="0.75" header="0.3" footer="0.3"/>')  # noqa: E501
+        xml.append('</worksheet>')
+        self._write(''.join(xml))
+        self._flush()
+        self.stream.close()
+        self.hyperlinks = []
+        if targets:
+            self.book.zf.writestr(self._rels_part(), self._rels(targets))
+
+    def _rels_part(self):
+        """ワークシートのリレーションシップのパート名
+        """
+        folder, name = self.part.rsplit('/', 1)
+        return f'{folder}/_rels/{name}.rels'
+
+    def _rels(self, targets):
+        """外部のブックへのハイパーリンクのリレーションシップ
+        """
+        xml = [XML_HEADER, f'<Relationships xmlns="{NS_PKG_REL}">']
+        for i, target in enumerate(targets, 1):
+            xml.append(f'<Relationship Id="rId{i}" Type="{NS_REL}/hyperlink" Target="{xml_attr(target)}" TargetMode="External"/>')  # noqa: E501
+        xml.append('</Relationships>')
+        return ''.join(xml)
+
+    def _open(self):
+        """ワークシートの出力を開始する
+        """
+        self.stream = self.book.zf.open(self.part, 'w')
+        xml = [XML_HEADER, f'<worksheet xmlns="{NS_MAIN}" xmlns:r="{NS_REL}">']
+        xml.append(self._sheet_views())
+        xml.append(f'<sheetFormatPr defaultRowHeight="{DEFAULT_FONT_SIZE + 2.25}"/>')  # noqa: E501
+        if self.widths:
+            xml.append('<cols>')
+            for index, width in sorted(self.widths.items()):
+                xml.append(f'<col min="{index}" max="{index}" width="{width}" customWidth="1"/>')  # noqa: E501
+            xml.append('</cols>')
+        xml.append('<sheetData>')
+        self._write(''.join(xml))
+
+    def _write(self, xml):
+        """バッファ経由で書き込む
+        """
+        self.buffer.append(xml)
+        self.buffer_size += len(xml)
+        if self.buffer_size >= WRITE_BUFFER_SIZE:
+            self._flush()
+
+    def _flush(self):
+        """バッファの内容を書き出す
+        """
+        self.stream.write(''.join(self.buffer).encode('utf-8'))
+        self.buffer = []
+        self.buffer_size = 0
+
+    def _sheet_views(self):
+        """ズームとウィンドウ枠の固定
+        """
+        zoom = f' zoomScale="{self.zoom}" zoomScaleNormal="{self.zoom}"' if self.zoom else ''  # noqa: E501
+        tab = ' tabSelected="1"' if self.part.endswith('sheet1.xml') else ''
+        xml = f'<sheetViews><sheetView{tab}{zoom} workbookViewId="0">'
+        if self.freeze_row:
+            top_left = f'A{self.freeze_row + 1}'
+            xml += f'<pane ySplit="{self.freeze_row}" topLeftCell="{top_left}" activePane="bottomLeft" state="frozen"/>'  # noqa: E501
+            xml += f'<selection pane="bottomLeft" activeCell="{self.home}" sqref="{self.home}"/>'  # noqa: E501
+        else:
+            xml += f'<selection activeCell="{self.home}" sqref="{self.home}"/>'
+        xml += '</sheetView></sheetViews>'
+        return xml
+
+
+class XlsxBook:
+    """ワークブック(xlsxファイル)
+
+    ワークシートは1枚ずつ順番に出力する(同時に複数は書き込めない)
+    shared_strings_maxが0の場合は共有文字列を使わない
+    """
+    def __init__(self, path, shared_strings_max=0):
+        self.path = path
+        self.zf = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+        self.styles = StyleSheet()
+        self.shared_strings = None
+        if shared_strings_max:
+            self.shared_strings = SharedStrings(shared_strings_max, SHARED_STRING_MAX_LENGTH)  # noqa: E501
+        self.sheets = []
+
+    def add_sheet(self, name):
+        """ワークシートを追加する
+        """
+        sheet = XlsxSheet(self, name, len(self.sheets) + 1)
+        self.sheets.append(sheet)
+        return sheet
+
+    def copy_sheet(self, name, src_zf, src_part):
+        """他のxlsxファイルのワークシートをそのまま追加する
+
+        共有文字列を使っていないワークシートのみ対象とし、使っている場合はNoneを返す
+        """
+        if uses_shared_strings(src_zf, src_part):
+            return None
+        sheet = self.add_sheet(name)
+        with src_zf.open(src_part) as src, self.zf.open(sheet.part, 'w') as dst:  # noqa: E501
+            shutil.copyfileobj(src, dst, WRITE_BUFFER_SIZE)
+        return sheet
+
+    def close(self):
+        """ブックの残りの部分を書き込んで閉じる
+        """
+        self.zf.writestr('[Content_Types].xml', self._content_types())
+        self.zf.writestr('_rels/.rels', self._root_rels())
+        self.zf.writestr('docProps/app.xml', self._app())
+        self.zf.writestr('docProps/core.xml', self._core())
+        self.zf.writestr('xl/workbook.xml', self._workbook())
+        self.zf.writestr('xl/_rels/workbook.xml.rels', self._workbook_rels())
+        self.zf.writestr('xl/styles.xml', self.styles.to_xml())
+        if self.shared_strings:
+            self.zf.writestr('xl/sharedStrings.xml', self.shared_strings.to_xml())  # noqa: E501
+        self.zf.close()
+
+    def _content_types(self):
+        """[Content_Types].xmlの中身
+        """
+        ct = 'application/vnd.openxmlformats-officedocument'
+        xml = [XML_HEADER, '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">']  # noqa: E501
+        xml.append('<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>')  # noqa: E501
+        xml.append('<Default Extension="xml" ContentType="application/xml"/>')
+        xml.append(f'<Override PartName="/xl/workbook.xml" ContentType="{ct}.spreadsheetml.sheet.main+xml"/>')  # noqa: E501
+        xml.append(f'<Override PartName="/xl/styles.xml" ContentType="{ct}.spreadsheetml.styles+xml"/>')  # noqa: E501
+        if self.shared_strings:
+            xml.append(f'<Override PartName="/xl/sharedStrings.xml" ContentType="{ct}.spreadsheetml.sharedStrings+xml"/>')  # noqa: E501
+        for sheet in self.sheets:
+            xml.append(f'<Override PartName="/{sheet.part}" ContentType="{ct}.spreadsheetml.worksheet+xml"/>')  # noqa: E501
+        xml.append(f'<Override PartName="/docProps/app.xml" ContentType="{ct}.extended-properties+xml"/>')  # noqa: E501
+        xml.append('<Override PartName="/docProps/core.xml" ContentType="application/vnd.openxmlformats-package.core-properties+xml"/>')  # noqa: E501
+        xml.append('</Types>')
+        return ''.join(xml)
+
+    def _root_rels(self):
+        """_rels/.relsの中身
+        """
+        return (
+            f'{XML_HEADER}<Relationships xmlns="{NS_PKG_REL}">'
+            f'<Relationship Id="rId1" Type="{NS_REL}/officeDocument" Target="xl/workbook.xml"/>'  # noqa: E501
+            f'<Relationship Id="rId2" Type="{NS_REL}/extended-properties" Target="docProps/app.xml"/>'  # noqa: E501
+            '<Relationship Id="rId3" Type="http://schemas.openxmlformats.org/package/2006/relationships/metadata/core-properties" Target="docProps/core.xml"/>'  # noqa: E501
+            '</Relationships>'
+        )
+
+    def _app(self):
+        """docProps/app.xmlの中身
+        """
+        return (
+            f'{XML_HEADER}<Properties xmlns="http://schemas.openxmlformats.org/officeDocument/2006/extended-properties">'  # noqa: E501
+            f'<Application>{APPLICATION}</Application></Properties>'
+        )
+
+    def _core(self):
+        """docProps/core.xmlの中身
+        """
+        now = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        return (
+            f'{XML_HEADER}<cp:coreProperties xmlns:cp="http://schemas.openxmlformats.org/package/2006/metadata/core-properties" '  # noqa: E501
+            'xmlns:dcterms="http://purl.org/dc/terms/" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'  # noqa: E501
+            f'<dcterms:created xsi:type="dcterms:W3CDTF">{now}</dcterms:created>'  # noqa: E501
+            f'<dcterms:modified xsi:type="dcterms:W3CDTF">{now}</dcterms:modified>'  # noqa: E501
+            '</cp:coreProperties>'
+        )
+
+    def _workbook(self):
+        """xl/workbook.xmlの中身
+        """
+        xml = [XML_HEADER, f'<workbook xmlns="{NS_MAIN}" xmlns:r="{NS_REL}">']
+        xml.append('<bookViews><workbookView activeTab="0"/></bookViews>')
+        xml.append('<sheets>')
+        for i, sheet in enumerate(self.sheets, 1):
+            xml.append(f'<sheet name="{xml_attr(sheet.name)}" sheetId="{i}" r:id="rId{i}"/>')  # noqa: E501
+        xml.append('</sheets>')
+        names = [(i, sheet) for i, sheet in enumerate(self.sheets) if sheet.autofilter]  # noqa: E501
+        if names:
+            xml.append('<definedNames>')
+            for i, sheet in names:
+                ref = '$' + sheet.autofilter.replace(':', ':$')
+                ref = re.sub(r'([A-Z]+)(\d+)', r'\1$\2', ref)
+                xml.append(f'<definedName name="_xlnm._FilterDatabase" localSheetId="{i}" hidden="1">{escape(quote_sheet_name(sheet.name))}!{ref}</definedName>')  # noqa: E501
+            xml.append('</definedNames>')
+        xml.append('</workbook>')
+        return ''.join(xml)
+
+    def _workbook_rels(self):
+        """xl/_rels/workbook.xml.relsの中身
+        """
+        xml = [XML_HEADER, f'<Relationships xmlns="{NS_PKG_REL}">']
+        for i, sheet in enumerate(self.sheets, 1):
+            target = sheet.part[len('xl/'):]
+            xml.append(f'<Relationship Id="rId{i}" Type="{NS_REL}/worksheet" Target="{target}"/>')  # noqa: E501
+        i = len(self.sheets) + 1
+        xml.append(f'<Relationship Id="rId{i}" Type="{NS_REL}/styles" Target="styles.xml"/>')  # noqa: E501
+        if self.shared_strings:
+            xml.append(f'<Relationship Id="rId{i+1}" Type="{NS_REL}/sharedStrings" Target="sharedStrings.xml"/>')  # noqa: E501
+        xml.append('</Relationships>')
+        return ''.join(xml)
+
+
+def estimate_bytes(pair):
+    """差分シートの大きさの見積もり(比較したファイルかファイル比較レポートのサイズ)
+    """
+    paths = [pair.report] if pair.report is not None else [pair.left, pair.right]  # noqa: E501
+    return sum(os.path.getsize(path) for path in paths if path and os.path.exists(path))  # noqa: E501
+
+
+def estimate_sheets(pair, max_rows=0, context=None):
+    """続きのシートを含めた差分シートの数の見積もり
+
+    内蔵エンジンの場合は編集操作から行数を求める(WinMergeの場合は1枚とする)
+    """
+    if not max_rows or not pair.opcodes:
+        return 1
+    return max(1, -(-pair.row_count(context) // max_rows))
+
+
+def plan_books(pairs, sheet_names, by_folder=False, max_sheets=0, max_bytes=0, max_rows=0, context=None):  # noqa: E501
+    """差分シートを出力するブックを分ける
+
+    by_folderの場合は最上位のフォルダごとに分け、さらにシート数(続きのシートを含む)
+    または見積もった大きさが上限を超える場合に次のブックへ分ける
+    差分シートがあるファイルの組のリストのリストを返す
+    """
+    groups = {}
+    for pair in pairs:
+        if pair.rel_path in sheet_names:
+            key = pair.folder.replace('/', '\\').split('\\')[0] if by_folder else ''  # noqa: E501
+            groups.setdefault(key, []).append(pair)
+
+    books = []
+    for group in groups.values():
+        book = []
+        size = sheets = 0
+        for pair in group:
+            pair_size = estimate_bytes(pair) if max_bytes else 0
+            pair_sheets = estimate_sheets(pair, max_rows, context) if max_sheets else 0  # noqa: E501
+            full = (max_sheets and sheets + pair_sheets > max_sheets) or (max_bytes and size + pair_size > max_bytes)  # noqa: E501
+            if book and full:
+                books.append(book)
+                book = []
+                size = sheets = 0
+            book.append(pair)
+            size += pair_size
+            sheets += pair_sheets
+        if book:
+            books.append(book)
+    return books
+
+
+class XlsxReportWriter:
+    """差分レポートをxlsxファイルに直接出力する
+    """
+    def __init__(self, path, formats, zoom, summary_start_row, diff_start_row, home, shared_strings_max=0, profiler=None, max_rows=0):  # noqa: E501
+        self.book = XlsxBook(path, shared_strings_max)
+        self.profiler = profiler or Profiler()
+        self.formats = formats
+        self.zoom = zoom
+        self.summary_start_row = summary_start_row
+        self.diff_start_row = diff_start_row
+        self.home = home
+        self.max_rows = max_rows  # 差分シート1枚あたりの最大行数(0 : 分けない)
+        self.no_cols = [f['col'] for f in formats['no']]
+        self.code_cols = [f['col'] for f in formats['code']]
+        self.extras = [f for f in formats.get('extra', []) if 'header' in f]
+        self.parts = {}       # 分けた差分シート名 -> 続きのシート名のリスト
+        self.used_names = set()
+        self._setup_styles()
+
+    def _setup_styles(self):
+        """使用する書式を登録する
+        """
+        styles = self.book.styles
+        self.header_style = styles.get(bold=True, border=BORDER_COLOR)
+        self.no_style = styles.get(size=NO_FONT_SIZE, fill=NO_COLOR)
+        self.code_styles = []
+        self.inline_props = []  # 行内の差分の書式(rPr)
+        for f in self.formats['code']:
+            font = f.get('font')
+            self.inline_props.append(run_props(font or DEFAULT_FONT, DEFAULT_FONT_SIZE, INLINE_COLOR))  # noqa: E501
+            self.code_styles.append({
+                op: styles.get(font=font, fill=None if color == 'FFFFFF' else color)  # noqa: E501
+                for op, color in DIFF_COLORS.items()
+            })
+        self.extra_header_style = styles.get(fill=HEADER_COLOR, border=BORDER_COLOR, align='center')  # noqa: E501
+        self.extra_unchanged_style = styles.get(fill=UNCHANGED_COLOR, border=BORDER_COLOR)  # noqa: E501
+        self.extra_changed_style = styles.get(border=BORDER_COLOR)
+
+    def write(self, base, latest, pairs, sheet_names, iter_rows, prev=None, carried=None):  # noqa: E501
+        """一覧シートと差分シートを出力する
+
+        sheet_namesはファイルの組の相対パスからシート名への対応、
+        iter_rowsはファイルの組から差分シートの行を返す関数、
+        carriedは前回のxlsxファイル(prev)から引き継ぐシート名から前回のシート名への対応
+        """
+        with self.profiler.phase('write_summary_sheet'):
+            self.write_summary_sheet(base, latest, pairs, sheet_names)
+        self.write_diff_sheets(pairs, sheet_names, iter_rows, prev, carried)
+
+    def write_index(self, base, latest, pairs, sheet_names, books):
+        """差分シートを別のブックに分けた場合の一覧シートだけのブックを出力する
+
+        booksはファイルの組の相対パスから差分シートを出力したブックのファイル名への対応
+        """
+        with self.profiler.phase('write_summary_sheet'):
+            self.write_summary_sheet(base, latest, pairs, sheet_names, books)
+        with self.profiler.phase('save_book'):
+            self.book.close()
+
+    def write_diff_sheets(self, pairs, sheet_names, iter_rows, prev=None, carried=None):  # noqa: E501
+        """差分シートを出力してブックを閉じる
+
+        pairsのうちsheet_namesにあるものだけを出力する
+        """
+        carried = carried or {}
+        self.used_names = {SUMMARY_SHEET_NAME.lower()} | {name.lower() for name in sheet_names.values()}  # noqa: E501
+        prev_parts = read_sheet_parts(prev) if carried else {}
+        prev_zf = zipfile.ZipFile(prev) if prev_parts else None
+        try:
+            for pair in pairs:
+                if pair.rel_path not in sheet_names:
+                    continue
+                name = sheet_names[pair.rel_path]
+                print(f'- {name} ...', end='', flush=True)
+                sheet = None
+                if carried.get(name) in prev_parts:
+                    with self.profiler.phase('copy_sheet', sheet=name):
+                        sheet = self.book.copy_sheet(name, prev_zf, prev_parts[carried[name]])  # noqa: E501
+                if sheet is not None:
+                    print(' carried over')
+                else:
+                    with self.profiler.phase('write_sheet', sheet=name):
+                        self.write_diff_sheet(name, pair, iter_rows(pair))
+                    print(' done')
+            with self.profiler.phase('save_book'):
+                self.book.close()
+        finally:
+            if prev_zf:
+                prev_zf.close()
+
+    def write_summary_sheet(self, base, latest, pairs, sheet_names, books=None):  # noqa: E501
+        """一覧シートを出力する
+
+        booksを指定した場合は外部のブックのシートへリンクし、ブックの列を追加する
+        """
+        header = SUMMARY_HEADER + ((BOOK_HEADER,) if books else ())
+        widths = SUMMARY_WIDTHS + ((BOOK_WIDTH,) if books else ())
+        sheet = self.book.add_sheet(SUMMARY_SHEET_NAME)
+        for i, width in enumerate(widths, 1):
+            sheet.set_width(col_name(i), width)
+        sheet.home = self.home
+
+        sheet.write_row(1, [('A', f'Compare {base} with {latest}', 0)])
+        sheet.write_row(2, [('A', datetime.now().strftime(DATE_FORMAT), 0)])
+        header_row = self.summary_start_row - 1
+        sheet.write_row(header_row, [
+            (col_name(i), text, self.header_style)
+            for i, text in enumerate(header, 1)
+        ])
+
+        book_col = col_name(len(header))
+        row = self.summary_start_row
+        for pair in pairs:
+            sheet_name = sheet_names.get(pair.rel_path)
+            book = books.get(pair.rel_path) if books else None
+            cells = [
+                ('A', sheet_name or pair.name, 0),
+                ('B', pair.folder, 0),
+                ('C', pair.status_text or STATUS_TEXTS[pair.status], 0),
+                ('D', format_date(pair.left_date), 0),
+                ('E', format_date(pair.right_date), 0),
+                ('F', pair.name.rsplit('.', 1)[1] if '.' in pair.name else '', 0),  # noqa: E501
+            ]
+            if book:
+                cells.append((book_col, book, 0))
+            sheet.write_row(row, cells)
+            if sheet_name:
+                sheet.add_hyperlink(f'A{row}', sheet_name, self.home, book)
+            row += 1
+        sheet.close()
+
+    def write_diff_sheet(self, name, pair, rows):
+        """差分シートを出力する
+
+        max_rowsを超える場合は差分がある行のまとまりの途中で切らないように
+        続きのシート(name_2, name_3, ...)に分ける
+        """
+        parts = [name]
+        sheet = self._open_diff_sheet(name, pair)
+        row = self.diff_start_row
+        hunk = []  # 書き込みを保留している差分がある行のまとまり
+        total = 0
+
+        def write(diff_rows):
+            nonlocal sheet, row
+            for diff_row in diff_rows:
+                if self.max_rows and row - self.diff_start_row >= self.max_rows:  # noqa: E501
+                    sheet, row = self._next_part(sheet, row, pair, parts)
+                sheet.write_row(row, self._diff_cells(diff_row))
+                row += 1
+
+        def flush_hunk():
+            nonlocal sheet, row
+            written = row - self.diff_start_row
+            if written and written + len(hunk) > self.max_rows:
+                sheet, row = self._next_part(sheet, row, pair, parts)
+            write(hunk)
+            hunk.clear()
+
+        for diff_row in rows:
+            total += 1
+            if not self.max_rows:
+                write((diff_row,))
+            elif diff_row.op in CHANGED_OPS:
+                hunk.append(diff_row)
+                if len(hunk) >= self.max_rows:
+                    flush_hunk()
+            else:
+                if hunk:
+                    flush_hunk()
+                write((diff_row,))
+        if hunk:
+            flush_hunk()
+        self.profiler.count('rows', total)
+
+        self._close_diff_sheet(sheet, row)
+        if len(parts) > 1:
+            self.parts[name] = parts[1:]
+
+    def _open_diff_sheet(self, name, pair, prev_name=None):
+        """差分シートを追加して見出しの行を書き込む
+
+        続きのシートの場合は前のシートへのリンクを付ける
+        """
+        sheet = self.book.add_sheet(name)
+        for key in self.formats.keys():
+            for f in self.formats[key]:
+                if 'width' in f:
+                    sheet.set_width(f['col'], f['width'])
+        sheet.zoom = self.zoom
+        sheet.freeze_row = self.diff_start_row - 1
+        sheet.home = self.home
+
+        header = [
+            (self.code_cols[0], str(pair.left), 0),
+            (self.code_cols[1], str(pair.right), 0),
+        ]
+        header += [(f['col'], f['header'], self.extra_header_style) for f in self.extras]  # noqa: E501
+        if prev_name:
+            header.append((self.no_cols[0], NAV_PREV_TEXT, 0))
+            sheet.add_hyperlink(f'{self.no_cols[0]}1', prev_name, self.home)
+        sheet.write_row(1, header)
+        return sheet
+
+    def _diff_cells(self, diff_row):
+        """差分シートの1行分のセル
+
+        行内の差分の範囲がある場合はその範囲の文字色を変える
+        追加列は移動先だけを確認する行とし、移動元にはMOVED_TEXTを表示する
+        """
+        cells = []
+        sides = (
+            (diff_row.left_no, diff_row.left_text, diff_row.left_spans),
+            (diff_row.right_no, diff_row.right_text, diff_row.right_spans),
+        )
+        for i, (no, text, spans) in enumerate(sides):
+            op = diff_row.op if text is not None else 'blank'
+            if text:
+                text, spans = expand_tabs(text, spans)
+                if spans:
+                    text = RichText(text, spans, self.inline_props[i])
+            cells.append((self.no_cols[i], no, self.no_style))
+            cells.append((self.code_cols[i], text, self.code_styles[i][op]))
+        for f in self.extras:
+            if diff_row.op in REVIEW_OPS:
+                cells.append((f['col'], '', self.extra_changed_style))
+            elif diff_row.op == OP_MOVED_FROM:
+                cells.append((f['col'], MOVED_TEXT, self.extra_unchanged_style))  # noqa: E501
+            else:
+                cells.append((f['col'], '-', self.extra_unchanged_style))
+        return cells
+
+    def _close_diff_sheet(self, sheet, row, next_name=None):
+        """最終行を書き込んで差分シートを閉じる
+
+        続きのシートがある場合は最終行にリンクを付ける
+        """
+        # 差分シートの最終行の次の行まで表を広げる
+        end_row = [(f['col'], '-', self.extra_unchanged_style) for f in self.extras]  # noqa: E501
+        if next_name:
+            end_row.append((self.code_cols[0], NAV_NEXT_TEXT.format(next_name), 0))  # noqa: E501
+            sheet.add_hyperlink(f'{self.code_cols[0]}{row}', next_name, self.home)  # noqa: E501
+        sheet.write_row(row, end_row)
+
+        sheet.autofilter = self._autofilter_range(self.extras)
+        sheet.close()
+
+    def _next_part(self, sheet, row, pair, parts):
+        """差分シートを閉じて続きのシートを開始する
+        """
+        next_name = self._continuation_name(parts[0], len(parts) + 1)
+        self._close_diff_sheet(sheet, row, next_name)
+        sheet = self._open_diff_sheet(next_name, pair, parts[-1])
+        parts.append(next_name)
+        return sheet, self.diff_start_row
+
+    def _continuation_name(self, name, number):
+        """続きのシート名(他のシート名と重複する場合は更に_Nを付ける)
+        """
+        suffix = f'_{number}'
+        n = 0
+        while True:
+            candidate = name[:MAX_SHEET_NAME - len(suffix)] + suffix
+            if candidate.lower() not in self.used_names:
+                self.used_names.add(candidate.lower())
+                return candidate
+            n += 1
+            suffix = f'_{number}_{n}'
+
+    def _autofilter_range(self, extras):
+        """オートフィルタの範囲
+        """
+        cols = sorted((f['col'] for f in extras if 'header' in f), key=col_index)  # noqa: E501
+        if not cols:
+            return None
+        start, end = cols[0], cols[-1]
+        if start == end:
+            end = col_name(col_index(start) + 1)
+        return f'{start}1:{end}1'